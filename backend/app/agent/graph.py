@@ -4,31 +4,33 @@ from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig
 from typing import TypedDict, Annotated, List, Dict, Any, Optional
 from langgraph.graph.message import add_messages
 import os
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import AsyncSession
 import json # Import json for parsing tool call arguments
 
 load_dotenv()
 
 from .tools import (
     log_interaction,
+    log_interactions,
     edit_interaction,
     search_hcp,
+    find_similar_interactions,
     suggest_follow_up,
     generate_summary,
     check_compliance,
     set_user_name,
     extract_interaction_data,
 )
+from .router import ToolRouter, describes_new_interaction
 
 class AgentState(TypedDict):
     messages: Annotated[List, add_messages]
     interaction_data: Dict[str, Any]  # ← this will hold extracted fields
     raw_user_input: str # Store the initial human message
-    db_session: Optional[AsyncSession]
     last_interaction_id: Optional[int]
     user_name: Optional[str] # Add user_name to AgentState
 
@@ -38,8 +40,25 @@ llm = ChatGroq(
 )
 
 # Tools list, now also used by the extraction_node
-tools = [log_interaction, edit_interaction, search_hcp, suggest_follow_up, generate_summary, check_compliance, set_user_name, extract_interaction_data]
-llm_with_tools = llm.bind_tools(tools)
+tools = [log_interaction, log_interactions, edit_interaction, search_hcp, find_similar_interactions, suggest_follow_up, generate_summary, check_compliance, set_user_name, extract_interaction_data]
+
+# Binds only the tools each turn needs; bindings are cached per tool subset
+router = ToolRouter(llm, tools)
+
+# The extraction node always uses the same two tools, so bind them once
+extraction_llm = llm.bind_tools([extract_interaction_data, set_user_name])
+
+# One capability line per tool; only the lines for the routed tools go into the prompt
+TOOL_PROMPT_LINES = {
+    "log_interaction": "- Log a new interaction (via the `log_interaction` tool, but only AFTER an interaction's data has been extracted by `extract_interaction_data`).",
+    "log_interactions": "- Log several interactions described in one message, such as an end-of-day recap (via a single `log_interactions` call with all of them).",
+    "edit_interaction": "- Edit an existing interaction (via the `edit_interaction` tool).",
+    "search_hcp": "- Search for HCP details (via the `search_hcp` tool).",
+    "find_similar_interactions": "- Find similar past interactions by topic or situation (via the `find_similar_interactions` tool).",
+    "suggest_follow_up": "- Suggest follow-up actions (via the `suggest_follow_up` tool).",
+    "generate_summary": "- Generate a summary of interaction notes (via the `generate_summary` tool).",
+    "set_user_name": "- Remember the user's name (via the `set_user_name` tool).",
+}
 
 # Prompt for the LLM's general conversational agent
 agent_prompt = ChatPromptTemplate.from_messages([
@@ -48,17 +67,12 @@ You are an intelligent AI assistant for pharmaceutical field representatives.
 Your primary goal is to help the user manage HCP interactions.
 
 You can perform the following actions based on user requests:
-- Log a new interaction (via the `log_interaction` tool, but only AFTER an interaction's data has been extracted by `extract_interaction_data`).
-- Edit an existing interaction (via the `edit_interaction` tool).
-- Search for HCP details (via the `search_hcp` tool).
-- Suggest follow-up actions (via the `suggest_follow_up` tool).
-- Generate a summary of interaction notes (via the `generate_summary` tool).
-- Remember the user's name (via the `set_user_name` tool).
+{capabilities}
 
 Always provide clear, friendly, and concise responses.
 
 FYI: The ID of the most recent interaction in the database is {last_interaction_id}. Use this ID if the user refers to "the last one" or a recent interaction without specifying an ID.
-{user_greeting}
+{saved_note}{user_greeting}
 """),
     MessagesPlaceholder(variable_name="messages"),
 ])
@@ -69,6 +83,7 @@ extraction_prompt = ChatPromptTemplate.from_messages([
 You are an expert at extracting structured data about HCP interactions.
 Your ONLY task is to extract details from the user's message into the `extract_interaction_data` tool.
 ALWAYS call the `extract_interaction_data` tool with ALL relevant information you can extract.
+If the message describes several visits, calls or meetings, return one entry per interaction in a single call.
 If the user also provides their name, call the `set_user_name` tool.
 Do NOT generate any conversational text. ONLY call tools.
 """),
@@ -82,15 +97,13 @@ def extraction_node(state: AgentState):
     It also handles `set_user_name` if the user's name is provided.
     """
     
-    # Bind only the extraction tools for this LLM invocation
-    extraction_llm = llm.bind_tools([extract_interaction_data, set_user_name])
-    
     # Invoke the LLM with the extraction_prompt
     llm_response = extraction_llm.invoke(
         extraction_prompt.format_messages(messages=state["messages"])
     )
     
     extracted_fields = state.get("interaction_data", {}).copy()
+    extracted_interactions = []
     new_messages = [llm_response] # Start with the LLM's response
 
     # Process tool calls from the LLM's response and execute them
@@ -103,9 +116,8 @@ def extraction_node(state: AgentState):
             if tool_name == "extract_interaction_data":
                 tool_output = extract_interaction_data.func(**tool_args)
                 if tool_output and "extracted_data" in tool_output:
-                    for key, value in tool_output["extracted_data"].items():
-                        if value is not None:
-                            extracted_fields[key] = value
+                    for record in tool_output["extracted_data"]:
+                        extracted_interactions.append({k: v for k, v in record.items() if v is not None})
             elif tool_name == "set_user_name":
                 tool_output = set_user_name.func(**tool_args)
                 if tool_output and "user_name" in tool_output and tool_output["user_name"] is not None:
@@ -114,12 +126,33 @@ def extraction_node(state: AgentState):
             if tool_output is not None:
                 new_messages.append(ToolMessage(content=json.dumps(tool_output), tool_call_id=tool_call["id"])) # Add tool result as ToolMessage
     
+    if extracted_interactions:
+        extracted_fields["interactions"] = extracted_interactions
+
     return {
         "messages": new_messages, # Return both LLM response and tool outputs
         "interaction_data": extracted_fields,
         "user_name": state.get("user_name"), # Propagate user_name
     }
 
+async def save_interactions_node(state: AgentState, config: RunnableConfig):
+    """
+    Saves the extracted (and summarised) interactions as one batch, so a dictated
+    visit is recorded even when the agent makes no log call. Turns that edit or
+    look up past interactions are left to the agent.
+    """
+    interaction_data = state["interaction_data"]
+    interactions = interaction_data.get("interactions")
+    if not interactions or not describes_new_interaction(state.get("raw_user_input", "")):
+        return {}
+
+    saved = await log_interactions.coroutine(interactions=interactions, config=config)
+    interaction_data["saved"] = saved
+    update = {"interaction_data": interaction_data}
+    if saved.get("interactions"):
+        update["last_interaction_id"] = saved["interactions"][-1]["id"]
+    return update
+
 def agent_node(state: AgentState):
     """
     This is the main agent node that handles general conversation and tool execution 
@@ -128,15 +161,32 @@ def agent_node(state: AgentState):
     user_greeting = ""
     if state.get("user_name"):
         user_greeting = f"\nRemember, the user's name is {state['user_name']}."
+
+    saved_note = ""
+    saved = state.get("interaction_data", {}).get("saved") or {}
+    if saved.get("interactions"):
+        saved_note = "The interaction(s) described in the user's latest message are already saved:\n" + "\n".join(
+            f"- ID #{i['id']}: {i['hcp_name']} on {i['date'][:10]}" for i in saved["interactions"]
+        ) + "\nDo NOT log them again; confirm they were saved and handle anything else the user asked for.\n"
+    elif saved.get("message"):
+        saved_note = f"Saving the interaction(s) in the user's latest message failed: {saved['message']}\n"
     
-    # Invoke the LLM with the full list of tools
-    response = llm_with_tools.invoke(
+    # Route the turn to a minimal tool subset and invoke the LLM bound to just those tools
+    intents, tool_names = router.route(
+        state.get("raw_user_input", ""),
+        extracted=bool(state.get("interaction_data", {}).get("interactions")),
+    )
+    capabilities = "\n".join(line for name, line in TOOL_PROMPT_LINES.items() if name in tool_names)
+    response = router.bind(tool_names).invoke(
         agent_prompt.format_messages(
             messages=state["messages"],
+            capabilities=capabilities,
             last_interaction_id=state.get("last_interaction_id", "not available"),
+            saved_note=saved_note,
             user_greeting=user_greeting,
         )
     )
+    router.record(intents, tool_names, response)
     
     return {
         "messages": [response],
@@ -147,21 +197,26 @@ def agent_node(state: AgentState):
 
 def generate_summary_node(state: AgentState):
     interaction_data = state["interaction_data"]
+    interactions = interaction_data.get("interactions", [])
     raw_user_input = state.get("raw_user_input", "") # Use raw user input for summary generation
 
-    if not interaction_data.get("summary"): # If summary is missing, generate it
+    for record in interactions:
+        if record.get("summary"): # Only generate summaries that are missing
+            continue
         summary_raw_text_parts = []
-        if interaction_data.get("hcp_name"):
-            summary_raw_text_parts.append(f"HCP: {interaction_data['hcp_name']}")
-        if interaction_data.get("interaction_type"):
-            summary_raw_text_parts.append(f"Type: {interaction_data['interaction_type']}")
-        if interaction_data.get("topics"):
-            summary_raw_text_parts.append(f"Topics: {interaction_data['topics']}")
-        if interaction_data.get("materials_distributed"):
-            summary_raw_text_parts.append(f"Materials: {interaction_data['materials_distributed']}")
-        if interaction_data.get("outcomes"):
-            summary_raw_text_parts.append(f"Outcome: {interaction_data['outcomes']}")
-        if raw_user_input: # Fallback to raw user input if other fields are sparse
+        if record.get("hcp_name"):
+            summary_raw_text_parts.append(f"HCP: {record['hcp_name']}")
+        if record.get("interaction_type"):
+            summary_raw_text_parts.append(f"Type: {record['interaction_type']}")
+        if record.get("topics"):
+            summary_raw_text_parts.append(f"Topics: {record['topics']}")
+        if record.get("materials_distributed"):
+            summary_raw_text_parts.append(f"Materials: {record['materials_distributed']}")
+        if record.get("outcomes"):
+            summary_raw_text_parts.append(f"Outcome: {record['outcomes']}")
+        # Fallback to raw user input if other fields are sparse; a multi-visit
+        # recap would leak the other visits into this summary, so skip it then
+        if raw_user_input and len(interactions) == 1:
             summary_raw_text_parts.append(f"Original request: {raw_user_input}")
 
 
@@ -169,13 +224,15 @@ def generate_summary_node(state: AgentState):
 
         generated_summary = generate_summary.func(raw_text=summary_raw_text)
         
-        interaction_data["summary"] = generated_summary.replace("Summary: ", "")
+        record["summary"] = generated_summary.replace("Summary: ", "")
     
     return {"interaction_data": interaction_data}
 
 def compliance_node(state: AgentState):
     interaction_data = state["interaction_data"]
-    topics = interaction_data.get("topics", "")
+    topics = "; ".join(
+        record["topics"] for record in interaction_data.get("interactions", []) if record.get("topics")
+    )
 
     compliance_output = check_compliance.func(topics=topics)
     
@@ -190,8 +247,13 @@ workflow = StateGraph(AgentState)
 workflow.add_node("extraction_node", extraction_node) # First, always try to extract data
 workflow.add_node("generate_summary_node", generate_summary_node)
 workflow.add_node("compliance_node", compliance_node)
+workflow.add_node("save_interactions_node", save_interactions_node) # Saves the extracted batch
 workflow.add_node("agent_node", agent_node) # The general agent for conversational responses
-workflow.add_node("tools", ToolNode(tools)) # Node to execute tools called by agent_node
+# Node to execute tools called by agent_node. Under graph.ainvoke, parallel tool calls
+# run concurrently; DB tools read the session from config["configurable"]["db_session"].
+# DB tools report their own failures; handle_tool_errors turns any other exception
+# into an error ToolMessage instead of failing the whole turn.
+workflow.add_node("tools", ToolNode(tools, handle_tool_errors=True))
 
 
 workflow.set_entry_point("extraction_node") # The very first step is data extraction
@@ -200,12 +262,15 @@ workflow.set_entry_point("extraction_node") # The very first step is data extrac
 # From extraction node, go to summary generation if needed, else to compliance check
 workflow.add_conditional_edges(
     "extraction_node",
-    lambda state: "generate_summary_node" if not state["interaction_data"].get("summary") else "compliance_node",
+    lambda state: "generate_summary_node"
+    if any(not record.get("summary") for record in state["interaction_data"].get("interactions", []))
+    else "compliance_node",
     {"generate_summary_node": "generate_summary_node", "compliance_node": "compliance_node"}
 )
 
 workflow.add_edge("generate_summary_node", "compliance_node")
-workflow.add_edge("compliance_node", "agent_node") # After compliance, agent provides final response
+workflow.add_edge("compliance_node", "save_interactions_node")
+workflow.add_edge("save_interactions_node", "agent_node") # After saving, agent provides final response
 
 # The agent_node can decide to call tools (like log_interaction, edit_interaction, search_hcp)
 workflow.add_conditional_edges(
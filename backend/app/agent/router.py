@@ -0,0 +1,189 @@
+# backend/app/agent/router.py
+"""
+Cheap intent router that decides which tool schemas are sent to the LLM.
+
+Tool schemas dominate the agent prompt, so each turn is classified first
+(keyword rules, then an optional nearest-centroid fallback over the local
+hashed embeddings from `similarity`) and only the matching tools are bound.
+Bindings are built once per tool subset and reused.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from .. import similarity
+
+# Intent -> names of the tools it needs
+INTENT_TOOLS: Dict[str, Tuple[str, ...]] = {
+    "log": ("log_interaction", "log_interactions"),
+    "edit": ("edit_interaction",),
+    "search": ("search_hcp",),
+    "similar": ("find_similar_interactions",),
+    "follow_up": ("suggest_follow_up",),
+    "summary": ("generate_summary",),
+    "compliance": ("check_compliance",),
+    "user_name": ("set_user_name",),
+}
+
+INTENT_RULES: Dict[str, re.Pattern] = {
+    "log": re.compile(r"\b(log|record|save|met|meeting|visit(ed|s)?|called|call with|saw|spoke|recap|had a)\b", re.I),
+    "edit": re.compile(r"\b(edit|update|change|correct|fix|modify|amend)\b", re.I),
+    "search": re.compile(r"\b(search|find|show|history|look ?up|list|interactions? (with|for))\b", re.I),
+    "similar": re.compile(r"\b(similar|last time|like this|related|comparable)\b", re.I),
+    "follow_up": re.compile(r"\b(follow[- ]?up|next steps?|what should i do)\b", re.I),
+    "summary": re.compile(r"\bsummar(y|ise|ize)\b", re.I),
+    "compliance": re.compile(r"(complian|off-label|regulat)", re.I),
+    "user_name": re.compile(r"\b(my name is|call me)\b", re.I),
+}
+
+# Example utterances for the embedding fallback, used when no rule fires
+INTENT_EXAMPLES: Dict[str, Sequence[str]] = {
+    "log": [
+        "I had a meeting with Dr. Smith today about Product X",
+        "Dr. Rao and I discussed efficacy data, outcome was positive",
+        "Quick recap of today's visits with three oncologists",
+    ],
+    "edit": [
+        "the date on that interaction is wrong it should be Monday",
+        "set the outcome of interaction 12 to negative",
+    ],
+    "search": [
+        "what interactions do we have with Dr. Rao",
+        "pull up everything about Dr. Mehta",
+    ],
+    "similar": [
+        "what happened when we discussed side effects with other cardiologists",
+        "have we had conversations like this one before",
+    ],
+    "follow_up": ["what should happen after a negative meeting", "recommend the next action"],
+    "summary": ["condense these notes for me", "give me a short recap of these notes"],
+    "compliance": ["is it ok that we talked about pricing and discounts", "check these topics for problems"],
+    "user_name": ["hi I'm Priya", "this is Alex from the north territory"],
+}
+
+# Intents that edit or look up past interactions rather than describe a new one
+QUERY_INTENTS = frozenset({"edit", "search", "similar"})
+
+# Intents that decide what the turn is about; the others (follow-up, summary,
+# compliance, user name) only add their tools on top of these
+PRIMARY_INTENTS = frozenset({"log"}) | QUERY_INTENTS
+
+USE_EMBEDDING_ROUTER = os.getenv("INTENT_ROUTER_EMBEDDINGS", "1") != "0"
+EMBEDDING_MIN_SCORE = float(os.getenv("INTENT_ROUTER_MIN_SCORE", "0.3"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for relative comparisons."""
+    return len(text) // 4 + 1
+
+
+def rule_intents(text: str) -> List[str]:
+    """Intents whose keyword rule matches `text`."""
+    return [intent for intent, pattern in INTENT_RULES.items() if pattern.search(text)]
+
+
+def describes_new_interaction(text: str) -> bool:
+    """
+    False when the keyword rules say the turn edits or looks up past interactions
+    without also logging one; fields extracted from such a turn describe the query,
+    not a new visit.
+    """
+    intents = set(rule_intents(text))
+    return "log" in intents or not intents & QUERY_INTENTS
+
+
+class ToolRouter:
+    """Selects a minimal tool subset per turn and caches the LLM bound to each subset."""
+
+    def __init__(self, llm: Any, tools: Sequence[Any]):
+        self.llm = llm
+        self.tools = {t.name: t for t in tools}
+        self.schema_tokens = {
+            name: estimate_tokens(json.dumps(convert_to_openai_tool(t))) for name, t in self.tools.items()
+        }
+        self._bindings: Dict[FrozenSet[str], Any] = {}
+        self.stats = {
+            "turns": 0,
+            "fallback_turns": 0,
+            "schema_tokens_sent": 0,
+            "schema_tokens_all_tools": 0,
+            "input_tokens_reported": 0,
+        }
+
+        # Precompute the bindings every single-intent turn and the fallback will use
+        self.bind(frozenset(self.tools))
+        for names in INTENT_TOOLS.values():
+            self.bind(frozenset(names) & frozenset(self.tools))
+
+        self._intent_names: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        if USE_EMBEDDING_ROUTER:
+            self._intent_names = list(INTENT_EXAMPLES)
+            centroids = np.stack([
+                similarity.embed_batch(INTENT_EXAMPLES[intent]).mean(axis=0) for intent in self._intent_names
+            ])
+            self._centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def bind(self, tool_names: FrozenSet[str]) -> Any:
+        """Returns the LLM bound to exactly these tools, building the binding once."""
+        bound = self._bindings.get(tool_names)
+        if bound is None:
+            bound = self._bindings[tool_names] = self.llm.bind_tools(
+                [t for name, t in self.tools.items() if name in tool_names]
+            )
+        return bound
+
+    def classify(self, text: str) -> List[str]:
+        """Returns the intents found in `text`; empty when nothing is confident enough."""
+        intents = rule_intents(text)
+        if intents or self._centroids is None:
+            return intents
+        scores = self._centroids @ similarity.embed(text)
+        best = int(np.argmax(scores))
+        return [self._intent_names[best]] if scores[best] >= EMBEDDING_MIN_SCORE else []
+
+    def route(self, text: str, extracted: bool = False) -> Tuple[List[str], FrozenSet[str]]:
+        """
+        Returns (intents, tool names) for a turn. `extracted` says the extraction node
+        found interactions, which always brings in the log tools. All tools are bound
+        when no primary intent is detected, since an auxiliary keyword alone ("follow
+        up", "my name is") says nothing about what else the turn needs.
+        """
+        intents = self.classify(text)
+        if extracted and "log" not in intents:
+            intents = ["log"] + intents
+        if not PRIMARY_INTENTS.intersection(intents):
+            return intents, frozenset(self.tools)
+        names = frozenset(name for intent in intents for name in INTENT_TOOLS[intent]) & frozenset(self.tools)
+        return intents, names
+
+    def record(self, intents: List[str], tool_names: FrozenSet[str], response: Any = None):
+        """Accumulates token telemetry for one routed turn and prints a summary line."""
+        sent = sum(self.schema_tokens[name] for name in tool_names)
+        full = sum(self.schema_tokens.values())
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+
+        self.stats["turns"] += 1
+        self.stats["fallback_turns"] += 1 if len(tool_names) == len(self.tools) else 0
+        self.stats["schema_tokens_sent"] += sent
+        self.stats["schema_tokens_all_tools"] += full
+        self.stats["input_tokens_reported"] += input_tokens
+
+        print(
+            f"=== ROUTER: intents={intents or ['<fallback>']} tools={len(tool_names)}/{len(self.tools)} "
+            f"schema_tokens~{sent} (all tools ~{full}) input_tokens={input_tokens or 'n/a'} ==="
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        """Cumulative telemetry, including the estimated schema-token reduction."""
+        stats = dict(self.stats)
+        full = stats["schema_tokens_all_tools"]
+        stats["schema_tokens_saved"] = full - stats["schema_tokens_sent"]
+        stats["schema_token_reduction"] = round(stats["schema_tokens_saved"] / full, 3) if full else 0.0
+        stats["cached_bindings"] = len(self._bindings)
+        return stats
@@ -1,11 +1,169 @@
 # backend/app/agent/tools.py
 from langchain_core.tools import tool
-from typing import Dict, Any, Optional, Union
+from langchain_core.runnables import RunnableConfig
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
+import asyncio
+import dateparser
+
+from .. import crud, schemas, similarity
+
+# How long the first search_hcp call in a turn waits for sibling calls before
+# the batched query is sent. Parallel tool calls start within the same few ticks.
+SEARCH_BATCH_WINDOW = 0.002
+
+
+def _get_db(config: RunnableConfig) -> AsyncSession:
+    """Returns the request's DB session passed as graph config `configurable.db_session`."""
+    db = (config or {}).get("configurable", {}).get("db_session")
+    if db is None:
+        raise RuntimeError("No db_session in graph config; invoke the graph with config={'configurable': {'db_session': db}}")
+    return db
+
+
+def _db_lock(db: AsyncSession) -> asyncio.Lock:
+    """
+    AsyncSession does not allow concurrent operations, so tools running in
+    parallel on the same session take turns through a per-session lock.
+    """
+    return db.info.setdefault("tool_lock", asyncio.Lock())
+
+
+async def _tool_failed(db: AsyncSession, tool_name: str, failure: str, error: Exception) -> Dict[str, Any]:
+    """
+    Rolls back the shared session after a failed DB tool and reports the failure
+    as the tool's message, so the other tool calls of the turn still complete.
+    """
+    print(f"DB Error in {tool_name}: {error}")
+    async with _db_lock(db):
+        await db.rollback()
+    return {
+        "tool_name": tool_name,
+        "message": f"❌ {failure}: {str(error)}",
+    }
+
+
+def _interaction_dict(interaction) -> Dict[str, Any]:
+    """JSON-safe dict of an ORM interaction, so ToolMessages stay valid JSON."""
+    return schemas.Interaction.model_validate(interaction).model_dump(mode="json")
+
+
+def _saved_key(data: Dict[str, Any]) -> tuple:
+    return (str(data.get("hcp_name") or "").strip().casefold(), str(data.get("date") or "")[:10])
+
+
+def _already_saved(db: AsyncSession, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The interaction for the same HCP and date saved earlier in this request, if any.
+    The extracted batch is saved before the agent runs, so a log tool call that
+    repeats it must not insert it twice.
+    """
+    return db.info.get("saved_interactions", {}).get(_saved_key(data))
+
+
+def _remember_saved(db: AsyncSession, interactions: List[Dict[str, Any]]):
+    saved = db.info.setdefault("saved_interactions", {})
+    for interaction in interactions:
+        saved[_saved_key(interaction)] = interaction
+
+
+def _format_interaction(interaction) -> str:
+    return (
+        f"- ID: {interaction.id}, HCP: {interaction.hcp_name}, Type: {interaction.interaction_type}, "
+        f"Date: {interaction.date}, Summary: {interaction.summary or 'N/A'}"
+    )
+
+
+def normalize_interaction_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Cleans LLM-provided fields (dates, enum casing) before schema validation."""
+    data = dict(data)
+
+    if "date" in data:
+        if not data["date"] or data["date"] == "not specified":
+            data["date"] = None
+        else:
+            # Use dateparser for robust date parsing; drop unparseable dates to avoid validation errors
+            parsed_date = dateparser.parse(str(data["date"]))
+            data["date"] = parsed_date.strftime('%Y-%m-%d') if parsed_date else None
+
+    if data.get("time") == "not specified":
+        data["time"] = None
+
+    if data.get("interaction_type"):
+        processed_interaction_type = data["interaction_type"].lower()
+        if processed_interaction_type == "virtual meeting":
+            processed_interaction_type = "virtual"  # Convert to 'virtual' to match enum before title()
+        data["interaction_type"] = processed_interaction_type.title()  # Ensures 'Meeting', 'Virtual', etc.
+
+    if data.get("outcomes"):
+        data["outcomes"] = data["outcomes"].title()  # Ensures 'Positive'
+
+    return data
+
+
+class ExtractedInteraction(BaseModel):
+    """One HCP interaction as extracted from the user's message."""
+    hcp_name: str
+    attendees: Optional[str] = None
+    date: Optional[str] = None  # IMPORTANT: Must be in YYYY-MM-DD format.
+    time: Optional[str] = None
+    interaction_type: str = "meeting"  # Default to lowercase
+    topics: Optional[str] = None
+    materials_distributed: Optional[str] = None
+    outcomes: str = "neutral"
+    follow_up: Optional[str] = None
+    summary: Optional[str] = None
+
+
+class _SearchBatcher:
+    """
+    Coalesces the search_hcp calls issued in one turn into a single SQL query.
+    The first call opens a short window; every call made before it closes shares
+    the result of `crud.get_interactions_by_hcp_names`.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.pending: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def search(self, name_query: str) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        if not self.pending:
+            self._flush_task = loop.create_task(self._flush())
+        future = self.pending.get(name_query)
+        if future is None:
+            future = self.pending[name_query] = loop.create_future()
+        return await future
+
+    async def _flush(self):
+        await asyncio.sleep(SEARCH_BATCH_WINDOW)
+        pending, self.pending = self.pending, {}
+        try:
+            async with _db_lock(self.db):
+                try:
+                    results = await crud.get_interactions_by_hcp_names(self.db, list(pending))
+                except Exception:
+                    await self.db.rollback()
+                    raise
+            for name_query, future in pending.items():
+                future.set_result(results.get(name_query, []))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+
+
+def _search_batcher(db: AsyncSession) -> _SearchBatcher:
+    return db.info.setdefault("search_batcher", _SearchBatcher(db))
+
 
 @tool
-def log_interaction(
+async def log_interaction(
     hcp_name: str,
+    config: RunnableConfig,
     attendees: Optional[str] = None, # New field: Attendees
     date: Optional[str] = None,  # IMPORTANT: Must be in YYYY-MM-DD format.
     time: Optional[str] = None,
@@ -17,35 +175,117 @@ def log_interaction(
     summary: Optional[str] = None
 ) -> Dict[str, Any]:
     """Log a new interaction with a Healthcare Professional into the CRM."""
-    
-    # If date is not provided, default to today's date
-    interaction_date = date if date else datetime.now().strftime('%Y-%m-%d')
-
-    # --- Preprocessing for interaction_type ---
-    processed_interaction_type = interaction_type.lower()
-    if processed_interaction_type == "virtual meeting":
-        processed_interaction_type = "virtual" # Convert to 'virtual' to match enum before title()
-    
-    # FORCE LOWERCASE to match your Pydantic Enums and Postgres Types
-    data = {
+    data = normalize_interaction_data({
         "hcp_name": hcp_name,
         "attendees": attendees, # Include attendees in data
-        "date": interaction_date,
+        "date": date,
         "time": time,
-        "interaction_type": processed_interaction_type.title(), # Ensures 'Meeting', 'Virtual', etc.
+        "interaction_type": interaction_type,
         "topics": topics,
         "materials_distributed": materials_distributed,
-        "outcomes": outcomes.title(),                 # Ensures 'positive'
+        "outcomes": outcomes,
         "follow_up": follow_up,
         "summary": summary,
+    })
+    # Default after normalising, which turns "not specified"/unparseable dates into None
+    data["date"] = data["date"] or datetime.now().strftime('%Y-%m-%d')
+    print("=== TOOL: log_interaction called with data:", data)
+
+    db = _get_db(config)
+    existing = _already_saved(db, data)
+    if existing:
+        return {
+            "tool_name": "log_interaction",
+            "interaction": existing,
+            "message": f"✅ Interaction for {hcp_name} is already saved with ID #{existing['id']}.",
+        }
+    try:
+        interaction_in = schemas.InteractionCreate(**data)
+        async with _db_lock(db):
+            new_interaction = await crud.create_interaction(db, interaction_in)
+    except Exception as e:
+        return await _tool_failed(db, "log_interaction", f"Interaction for {hcp_name} failed to save", e)
+
+    interaction = _interaction_dict(new_interaction)
+    _remember_saved(db, [interaction])
+    return {
+        "tool_name": "log_interaction",
+        "interaction": interaction,
+        "message": f"✅ Interaction for {hcp_name} saved successfully with ID #{new_interaction.id}!",
+    }
+
+
+_interaction_batch = TypeAdapter(List[schemas.InteractionCreate])
+
+
+@tool
+async def log_interactions(interactions: List[ExtractedInteraction], config: RunnableConfig) -> Dict[str, Any]:
+    """Log several interactions with Healthcare Professionals at once, e.g. from an end-of-day recap.
+    Use this instead of repeated `log_interaction` calls whenever the user describes more than one interaction.
+    All interactions are saved together or not at all.
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    records = []
+    try:
+        for interaction in interactions:
+            # Dicts when called with the extracted batch rather than by the LLM
+            data = (ExtractedInteraction.model_validate(interaction) if isinstance(interaction, dict) else interaction).model_dump()
+            data = normalize_interaction_data(data)
+            # If date is missing or unparseable, default to today's date (the column is NOT NULL)
+            data["date"] = data["date"] or today
+            records.append(data)
+    except ValidationError as e:
+        return {
+            "tool_name": "log_interactions",
+            "message": f"❌ No interactions saved: interaction {len(records) + 1} failed validation. {e}",
+        }
+    print(f"=== TOOL: log_interactions called with {len(records)} interaction(s) ===")
+
+    db = _get_db(config)
+    existing = [_already_saved(db, data) for data in records]
+    pending = [i for i, saved in enumerate(existing) if saved is None]
+
+    # Validate the whole batch up front so nothing is written if any record is invalid
+    try:
+        interactions_in = _interaction_batch.validate_python([records[i] for i in pending])
+    except ValidationError as e:
+        failed = sorted({pending[err["loc"][0]] + 1 for err in e.errors() if err["loc"]})
+        return {
+            "tool_name": "log_interactions",
+            "message": f"❌ No interactions saved: interaction(s) {', '.join(map(str, failed))} failed validation. {e}",
+        }
+
+    new_interactions = []
+    if interactions_in:
+        try:
+            async with _db_lock(db):
+                new_interactions = await crud.create_interactions(db, interactions_in)
+        except Exception as e:
+            return await _tool_failed(db, "log_interactions", "No interactions saved", e)
+    new_dicts = [_interaction_dict(i) for i in new_interactions]
+    _remember_saved(db, new_dicts)
+    for i, interaction in zip(pending, new_dicts):
+        existing[i] = interaction
+
+    already_saved = [existing[i] for i in range(len(existing)) if i not in pending]
+    reply_parts = []
+    if new_dicts:
+        reply_parts.append(f"✅ Saved {len(new_dicts)} interaction(s):")
+        reply_parts.extend(f"- ID #{i['id']}: {i['hcp_name']}" for i in new_dicts)
+    if already_saved:
+        reply_parts.append(f"✅ Already saved {len(already_saved)} interaction(s):")
+        reply_parts.extend(f"- ID #{i['id']}: {i['hcp_name']}" for i in already_saved)
+    return {
+        "tool_name": "log_interactions",
+        "interactions": existing,
+        "message": "\n".join(reply_parts),
     }
-    print("Logged data (Fixed for Schema):", data)
-    return data
 
 
 @tool
-def edit_interaction(
+async def edit_interaction(
     interaction_id: Union[int, str],
+    config: RunnableConfig,
     hcp_name: Optional[str] = None,
     attendees: Optional[str] = None, # New field: Attendees
     date: Optional[str] = None,  # IMPORTANT: Must be in YYYY-MM-DD format.
@@ -66,32 +306,127 @@ def edit_interaction(
     try:
         interaction_id = int(interaction_id)
     except (ValueError, TypeError):
-        # Handle cases where conversion fails, maybe return an error message
-        # For now, this assumes the LLM provides a number-like string or an int
-        pass
+        return {
+            "tool_name": "edit_interaction",
+            "message": f"❌ '{interaction_id}' is not an interaction ID. Please give the numeric ID to edit.",
+        }
 
-    updates = {k: v for k, v in locals().items() if v is not None and k != "interaction_id"}
+    updates = {
+        k: v for k, v in locals().items()
+        if v is not None and k not in ("interaction_id", "config")
+    }
+    # Normalising turns unusable values ("not specified", unparseable dates) into None;
+    # drop them afterwards so they don't become SET ... = NULL
+    updates = {k: v for k, v in normalize_interaction_data(updates).items() if v is not None}
 
     print(f"=== TOOL: edit_interaction called for ID {interaction_id} ===")
     print("Updates:", updates)
 
-    # Instead of returning a string, return structured data for the main endpoint to process
+    if not updates:
+        return {
+            "tool_name": "edit_interaction",
+            "interaction_id": interaction_id,
+            "message": f"❌ No usable changes for interaction #{interaction_id}. Please say which fields to change and to what.",
+        }
+
+    db = _get_db(config)
+    try:
+        update_schema = schemas.InteractionUpdate(**updates)
+        async with _db_lock(db):
+            updated_interaction = await crud.update_interaction(db, interaction_id, update_schema)
+    except Exception as e:
+        return await _tool_failed(db, "edit_interaction", f"Interaction #{interaction_id} edit failed to save", e)
+
+    if not updated_interaction:
+        return {
+            "tool_name": "edit_interaction",
+            "interaction_id": interaction_id,
+            "message": f"❌ Could not find interaction #{interaction_id} to update.",
+        }
+
+    updated_fields = ", ".join(updates.keys()) or "No changes"
     return {
         "tool_name": "edit_interaction",
         "interaction_id": interaction_id,
         "updates": updates,
+        "interaction": _interaction_dict(updated_interaction),
+        "message": f"✅ Interaction #{interaction_id} updated successfully! Fields changed: {updated_fields}.",
     }
 
 
 @tool
-def search_hcp(name_query: str) -> Dict[str, Any]:
+async def search_hcp(name_query: str, config: RunnableConfig) -> Dict[str, Any]:
     """Search for HCP details by name or specialty.
     The `name_query` should be the HCP's name or a part of it.
     """
     print(f"=== TOOL: search_hcp called with name_query: {name_query} ===")
+    try:
+        found_interactions = await _search_batcher(_get_db(config)).search(name_query)
+    except Exception as e:
+        # The batch already rolled the session back
+        print(f"DB Error in search_hcp: {e}")
+        return {
+            "tool_name": "search_hcp",
+            "query": name_query,
+            "message": f"❌ Search for '{name_query}' failed: {str(e)}",
+        }
+
+    if found_interactions:
+        reply_parts = [f"Found {len(found_interactions)} interaction(s) for '{name_query}':"]
+        reply_parts.extend(_format_interaction(interaction) for interaction in found_interactions)
+        message = "\n".join(reply_parts)
+    else:
+        message = f"❌ No interactions found for '{name_query}'."
+
     return {
         "tool_name": "search_hcp",
         "query": name_query,
+        "interaction_ids": [interaction.id for interaction in found_interactions],
+        "message": message,
+    }
+
+
+@tool
+async def find_similar_interactions(query: str, config: RunnableConfig, top_k: int = 5) -> Dict[str, Any]:
+    """Find past interactions whose topics, summary or follow-up are similar to the query.
+    Use this when the user asks what happened last time with similar HCPs, topics or products.
+    The `query` should describe the topic or situation, e.g. "Product X side effects".
+    """
+    top_k = max(1, min(int(top_k), 10))
+    # ~tens of ms of NumPy work at 1M rows; run it off the event loop
+    matches = await asyncio.to_thread(similarity.get_index().search, query, top_k)
+    print(f"=== TOOL: find_similar_interactions called with query: {query}, matches: {len(matches)} ===")
+
+    scores = dict(matches)
+    db = _get_db(config)
+    try:
+        async with _db_lock(db):
+            similar_interactions = await crud.get_interactions_by_ids(db, list(scores))
+    except Exception as e:
+        return await _tool_failed(db, "find_similar_interactions", f"Similarity search for '{query}' failed", e)
+
+    # Interactions removed outside the API (e.g. archived partitions) until the next rebuild
+    stale = set(scores) - {interaction.id for interaction in similar_interactions}
+    if stale:
+        await asyncio.to_thread(similarity.remove_interactions, stale)
+        matches = [(i, score) for i, score in matches if i not in stale]
+
+    if similar_interactions:
+        reply_parts = [f"Found {len(similar_interactions)} past interaction(s) similar to '{query}':"]
+        for interaction in similar_interactions:
+            reply_parts.append(
+                f"- ID: {interaction.id}, HCP: {interaction.hcp_name}, Date: {interaction.date}, "
+                f"Similarity: {scores[interaction.id]:.2f}, Summary: {interaction.summary or 'N/A'}"
+            )
+        message = "\n".join(reply_parts)
+    else:
+        message = f"❌ No similar interactions found for '{query}'."
+
+    return {
+        "tool_name": "find_similar_interactions",
+        "query": query,
+        "matches": [{"interaction_id": i, "score": round(score, 4)} for i, score in matches],
+        "message": message,
     }
 
 
@@ -135,33 +470,16 @@ def set_user_name(name: str) -> Dict[str, Any]:
     }
 
 @tool
-def extract_interaction_data(
-    hcp_name: str,
-    attendees: Optional[str] = None,
-    date: Optional[str] = None,  # IMPORTANT: Must be in YYYY-MM-DD format.
-    time: Optional[str] = None,
-    interaction_type: str = "meeting",  # Default to lowercase
-    topics: Optional[str] = None,
-    materials_distributed: Optional[str] = None,
-    outcomes: str = "neutral",
-    follow_up: Optional[str] = None,
-    summary: Optional[str] = None
-) -> Dict[str, Any]:
-    """Extracts structured data for an HCP interaction from the user's input."""
-    data = {
-        "hcp_name": hcp_name,
-        "attendees": attendees,
-        "date": date,
-        "time": time,
-        "interaction_type": interaction_type,
-        "topics": topics,
-        "materials_distributed": materials_distributed,
-        "outcomes": outcomes,
-        "follow_up": follow_up,
-        "summary": summary,
-    }
-    print(f"=== TOOL: extract_interaction_data called with data: {data} ===")
+def extract_interaction_data(interactions: List[ExtractedInteraction]) -> Dict[str, Any]:
+    """Extracts structured data for HCP interactions from the user's input.
+    Return one entry per distinct visit, call or meeting; an end-of-day recap of several visits yields several entries.
+    """
+    data = [
+        (ExtractedInteraction.model_validate(i) if isinstance(i, dict) else i).model_dump()
+        for i in interactions
+    ]
+    print(f"=== TOOL: extract_interaction_data called with {len(data)} interaction(s): {data} ===")
     return {
         "tool_name": "extract_interaction_data",
         "extracted_data": data,
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,104 @@
+# backend/app/attachments.py
+"""
+Content-addressed local store for interaction attachments.
+
+Blobs live at <ATTACHMENT_DIR>/<sha[:2]>/<sha[2:4]>/<sha256> and are written once:
+an upload is streamed to a temp file while being hashed, then renamed into place
+or discarded if an identical blob already exists. Metadata (filename, type,
+owning interaction) lives in the `attachments` table, so identical files
+attached to many interactions share one blob.
+
+Placing a blob and deleting an unreferenced one both happen in crud under a
+per-hash advisory lock, so an upload can't link to a blob that a concurrent
+delete is about to remove.
+"""
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachment_store")
+MAX_ATTACHMENT_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(100 * 1024 * 1024)))
+# When set (e.g. "/protected-attachments/"), downloads are handed to nginx via
+# X-Accel-Redirect so it serves the blob with sendfile instead of Python
+ACCEL_REDIRECT_PREFIX = os.getenv("ATTACHMENT_ACCEL_REDIRECT_PREFIX")
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class AttachmentStore:
+    def __init__(self, root: str = ATTACHMENT_DIR, max_bytes: int = MAX_ATTACHMENT_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+
+    def relative_path(self, sha256: str) -> str:
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, self.relative_path(sha256))
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    async def save_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int, str]:
+        """
+        Writes an async byte stream to a temp file in the store chunk by chunk and
+        returns (sha256, size, temp path); `place` or `discard` the temp file
+        afterwards. Raises AttachmentTooLarge past `max_bytes`.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        # Temp file on the same filesystem so the final rename is atomic
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AttachmentTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    await run_in_threadpool(f.write, chunk)
+
+            return digest.hexdigest(), size, tmp_path
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+
+    def place(self, tmp_path: str, sha256: str):
+        """Moves a staged upload to its content address, or drops it if that blob already exists."""
+        final_path = self.path(sha256)
+        if os.path.exists(final_path):
+            self.discard(tmp_path)  # Deduplicated: identical content is already stored
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+
+    def discard(self, tmp_path: str):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, sha256: str):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+_store = None
+
+
+def get_store() -> AttachmentStore:
+    global _store
+    if _store is None:
+        _store = AttachmentStore()
+    return _store
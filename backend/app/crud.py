@@ -1,12 +1,13 @@
 # backend/app/crud.py
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete, desc
-from typing import List, Optional
-from . import models, schemas  # we'll create schemas.py next
+from sqlalchemy import insert, update, delete, desc, or_, text
+from typing import Dict, List, Optional
+from datetime import datetime
+from . import attachments, models, schemas, similarity
 
-# backend/app/crud.py
-async def create_interaction(db: AsyncSession, interaction: schemas.InteractionCreate) -> models.Interaction:
+def _interaction_values(interaction: schemas.InteractionCreate) -> dict:
     # 1. Convert to dict (handles Pydantic v2 model_dump or v1 dict)
     data = interaction.model_dump() if hasattr(interaction, 'model_dump') else interaction.dict()
     
@@ -15,16 +16,48 @@ async def create_interaction(db: AsyncSession, interaction: schemas.InteractionC
     data['interaction_type'] = interaction.interaction_type.name
     if interaction.outcomes:
         data['outcomes'] = interaction.outcomes.name
+    return data
 
-    db_interaction = models.Interaction(**data)
+# backend/app/crud.py
+async def create_interaction(db: AsyncSession, interaction: schemas.InteractionCreate) -> models.Interaction:
+    db_interaction = models.Interaction(**_interaction_values(interaction))
     db.add(db_interaction)
     await db.commit()
     await db.refresh(db_interaction)
+    similarity.index_interactions([db_interaction])
     return db_interaction
 
-async def get_interactions(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[models.Interaction]:
-    """Get list of interactions (with pagination)."""
-    result = await db.execute(select(models.Interaction).offset(skip).limit(limit))
+async def create_interactions(db: AsyncSession, interactions: List[schemas.InteractionCreate]) -> List[models.Interaction]:
+    """Insert several interactions in one transaction with a single multi-row INSERT ... RETURNING."""
+    if not interactions:
+        return []
+    stmt = (
+        insert(models.Interaction)
+        .values([_interaction_values(interaction) for interaction in interactions])
+        .returning(models.Interaction)
+    )
+    result = await db.execute(stmt)
+    # Postgres assigns serial IDs in VALUES order; sort so callers get input order
+    new_interactions = sorted(result.scalars().all(), key=lambda interaction: interaction.id)
+    await db.commit()
+    similarity.index_interactions(new_interactions)
+    return new_interactions
+
+async def get_interactions(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> List[models.Interaction]:
+    """Get list of interactions (with pagination), optionally within [date_from, date_to).
+    Filtering on `date` lets Postgres prune the monthly partitions outside the range."""
+    query = select(models.Interaction)
+    if date_from:
+        query = query.filter(models.Interaction.date >= date_from)
+    if date_to:
+        query = query.filter(models.Interaction.date < date_to)
+    result = await db.execute(query.offset(skip).limit(limit))
     return result.scalars().all()
 async def get_interaction(db: AsyncSession, interaction_id: int) -> Optional[models.Interaction]:
     """Get a single interaction by ID."""
@@ -46,21 +79,195 @@ async def get_interactions_by_hcp_name(db: AsyncSession, hcp_name: str) -> List[
 
     return result.scalars().all()
 
+async def get_interactions_by_hcp_names(db: AsyncSession, hcp_names: List[str]) -> Dict[str, List[models.Interaction]]:
+    """Run several HCP name searches as one query; returns matches keyed by each search string."""
+    if not hcp_names:
+        return {}
+    result = await db.execute(
+        select(models.Interaction).filter(
+            or_(*(models.Interaction.hcp_name.ilike(f"%{name}%") for name in hcp_names))
+        )
+    )
+    interactions = result.scalars().all()
+    return {
+        name: [i for i in interactions if name.lower() in i.hcp_name.lower()]
+        for name in hcp_names
+    }
+
+async def get_interactions_by_ids(db: AsyncSession, interaction_ids: List[int]) -> List[models.Interaction]:
+    """Get interactions by ID, preserving the order of `interaction_ids`."""
+    if not interaction_ids:
+        return []
+    result = await db.execute(select(models.Interaction).filter(models.Interaction.id.in_(interaction_ids)))
+    by_id = {interaction.id: interaction for interaction in result.scalars().all()}
+    return [by_id[i] for i in interaction_ids if i in by_id]
+
+async def rebuild_similarity_index(db: AsyncSession, batch_size: int = 5000) -> int:
+    """
+    Re-embed every interaction into a fresh similarity index and swap it in once
+    complete; searches use the previous index meanwhile. Returns the row count.
+    """
+    rebuild = similarity.begin_rebuild()
+    last_id, total = 0, 0
+    try:
+        while True:
+            result = await db.execute(
+                select(models.Interaction)
+                .filter(models.Interaction.id > last_id)
+                .order_by(models.Interaction.id)
+                .limit(batch_size)
+            )
+            batch = result.scalars().all()
+            if not batch:
+                break
+            # Embedding is CPU-bound; keep the event loop free while a large table is indexed
+            items = [(i.id, similarity.interaction_text(i)) for i in batch]
+            await asyncio.to_thread(rebuild.add, items)
+            last_id, total = batch[-1].id, total + len(batch)
+    except BaseException:
+        similarity.abort_rebuild(rebuild)
+        raise
+    similarity.finish_rebuild(rebuild)
+    return total
+
 async def update_interaction(db: AsyncSession, interaction_id: int, updates: schemas.InteractionUpdate) -> Optional[models.Interaction]:
     """Update an existing interaction with new values."""
+    values = updates.dict(exclude_unset=True)
+    # Pass model enum members: the DB stores their names ('NEGATIVE'), and the session
+    # copies these values onto an already-loaded instance, which must stay an enum
+    if updates.interaction_type:
+        values['interaction_type'] = models.InteractionType[updates.interaction_type.name]
+    if updates.outcomes:
+        values['outcomes'] = models.OutcomeType[updates.outcomes.name]
     stmt = (
         update(models.Interaction)
         .where(models.Interaction.id == interaction_id)
-        .values(**updates.dict(exclude_unset=True))
+        .values(**values)
         .returning(models.Interaction)
     )
     result = await db.execute(stmt)
     await db.commit()
-    return result.scalars().first()
+    updated = result.scalars().first()
+    if updated:
+        similarity.index_interactions([updated])
+    return updated
 
 async def delete_interaction(db: AsyncSession, interaction_id: int) -> bool:
     """Delete an interaction (optional for demo)."""
     stmt = delete(models.Interaction).where(models.Interaction.id == interaction_id)
     result = await db.execute(stmt)
+    removed = await db.execute(
+        delete(models.Attachment)
+        .where(models.Attachment.interaction_id == interaction_id)
+        .returning(models.Attachment.sha256)
+    )
     await db.commit()
-    return result.rowcount > 0
\ No newline at end of file
+    similarity.remove_interactions([interaction_id])
+    await _release_blobs(db, set(removed.scalars().all()))
+    return result.rowcount > 0
+
+async def create_attachment(
+    db: AsyncSession,
+    interaction_id: int,
+    sha256: str,
+    size: int,
+    tmp_path: str,
+    filename: str,
+    content_type: Optional[str],
+) -> Optional[models.Attachment]:
+    """
+    Move an upload staged by the attachment store into place and record its metadata.
+    Returns None (and discards the upload) if the interaction no longer exists.
+    """
+    store = attachments.get_store()
+    db_attachment = models.Attachment(
+        interaction_id=interaction_id, sha256=sha256, size=size, filename=filename, content_type=content_type
+    )
+    try:
+        # There is no foreign key, so re-check the interaction in this transaction. The
+        # key-share lock makes a concurrent delete_interaction wait for our commit, after
+        # which its attachment cleanup sees the new row.
+        result = await db.execute(
+            select(models.Interaction.id)
+            .filter(models.Interaction.id == interaction_id)
+            .with_for_update(read=True, key_share=True)
+        )
+        if result.first() is None:
+            await db.rollback()
+            store.discard(tmp_path)
+            return None
+        # Placed under the blob's lock, so _release_blobs can't remove it between the
+        # dedupe check and the commit of the row that references it
+        await _lock_blob(db, sha256)
+        store.place(tmp_path, sha256)
+        db.add(db_attachment)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        store.discard(tmp_path)
+        # The blob may have been placed for this row alone
+        await _release_blobs(db, {sha256})
+        raise
+    await db.refresh(db_attachment)
+    return db_attachment
+
+async def get_attachment(db: AsyncSession, attachment_id: int) -> Optional[models.Attachment]:
+    result = await db.execute(select(models.Attachment).filter(models.Attachment.id == attachment_id))
+    return result.scalars().first()
+
+async def get_attachments_for_interaction(db: AsyncSession, interaction_id: int) -> List[models.Attachment]:
+    result = await db.execute(
+        select(models.Attachment)
+        .filter(models.Attachment.interaction_id == interaction_id)
+        .order_by(models.Attachment.id)
+    )
+    return result.scalars().all()
+
+async def delete_attachment(db: AsyncSession, attachment_id: int) -> bool:
+    """Delete attachment metadata, and its blob if no other attachment shares it."""
+    result = await db.execute(
+        delete(models.Attachment).where(models.Attachment.id == attachment_id).returning(models.Attachment.sha256)
+    )
+    sha256 = result.scalars().first()
+    await db.commit()
+    if sha256 is None:
+        return False
+    await _release_blobs(db, {sha256})
+    return True
+
+async def get_attachments_for_interactions(db: AsyncSession, interaction_ids: List[int]) -> List[models.Attachment]:
+    result = await db.execute(
+        select(models.Attachment)
+        .filter(models.Attachment.interaction_id.in_(interaction_ids))
+        .order_by(models.Attachment.id)
+    )
+    return result.scalars().all()
+
+async def delete_attachments_for_interactions(db: AsyncSession, interaction_ids: List[int]) -> int:
+    """Delete the attachments of several interactions, and blobs nothing else shares."""
+    result = await db.execute(
+        delete(models.Attachment)
+        .where(models.Attachment.interaction_id.in_(interaction_ids))
+        .returning(models.Attachment.sha256)
+    )
+    removed = result.scalars().all()
+    await db.commit()
+    await _release_blobs(db, set(removed))
+    return len(removed)
+
+async def _lock_blob(db: AsyncSession, sha256: str):
+    """Per-blob lock shared by all API workers; released when the transaction ends."""
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:sha256))"), {"sha256": sha256})
+
+async def _release_blobs(db: AsyncSession, sha256s: set):
+    """Remove blobs that no attachment row references any more."""
+    store = attachments.get_store()
+    for sha256 in sha256s:
+        # Re-checked under the lock create_attachment holds while placing the blob
+        await _lock_blob(db, sha256)
+        result = await db.execute(
+            select(models.Attachment.id).filter(models.Attachment.sha256 == sha256).limit(1)
+        )
+        if result.first() is None:
+            store.delete(sha256)
+        await db.commit()
\ No newline at end of file
@@ -8,6 +8,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import engine, Base
 from app import models  # Essential: Base needs to see the models
+from app import similarity
+from app import migrations, partitions
 
 async def init_db():
     async with engine.begin() as conn:
@@ -18,10 +20,20 @@ async def init_db():
         await conn.execute(sa.text("DROP TYPE IF EXISTS interactiontype CASCADE"))
 
         await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(sa.text(f"DROP TABLE IF EXISTS {partitions.TABLE}_legacy CASCADE"))
 
         print("Creating new tables and enum types...")
         await conn.run_sync(Base.metadata.create_all)
 
+        print("Creating interaction partitions...")
+        await partitions.ensure_partitions(conn)
+
+    # The fresh schema already matches every migration
+    await migrations.stamp_head(engine)
+
+    # The similarity index mirrors hcp_interactions; ask the API to rebuild it
+    similarity.request_rebuild()
+
     print("🚀 Database reset successfully! Enums are now synced.")
 
 if __name__ == "__main__":
@@ -1,23 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 from datetime import datetime # Import datetime
 
-from .agent.graph import graph, AgentState
-from .database import get_db
-from . import crud, schemas
+from .agent.graph import graph, AgentState, router
+from .database import AsyncSessionLocal, engine, get_db
+from . import attachments, crud, partitions, schemas, similarity
 
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+import asyncio
 import json
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
-import dateparser
+from urllib.parse import quote
 
 load_dotenv()
 
-app = FastAPI(title="Aivoa AI CRM HCP Log Interaction")
+# How often upcoming monthly partitions of hcp_interactions are created
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_HOURS", "24")) * 3600
+
+async def partition_maintenance_loop():
+    while True:
+        try:
+            await partitions.maintain_partitions(engine)
+        except Exception as e:
+            print(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+# How often the API checks for a similarity index rebuild requested by another process
+SIMILARITY_REBUILD_POLL_INTERVAL = float(os.getenv("SIMILARITY_REBUILD_POLL_SECONDS", "60"))
+
+async def rebuild_similarity_index():
+    try:
+        async with AsyncSessionLocal() as db:
+            total = await crud.rebuild_similarity_index(db)
+        print(f"Similarity index built from {total} interaction(s)")
+    except Exception as e:
+        print(f"Similarity index build failed: {e}")
+        similarity.request_rebuild()  # Retry on the next poll
+
+async def similarity_index_loop():
+    """
+    This process is the index's only writer (see `similarity`). Fills the index on
+    startup if it is empty (e.g. an existing database) and rebuilds it whenever the
+    migrate CLI or init_db asks for it.
+    """
+    if len(similarity.get_index()) == 0:
+        similarity.request_rebuild()
+    while True:
+        if similarity.take_rebuild_request():
+            await rebuild_similarity_index()
+        await asyncio.sleep(SIMILARITY_REBUILD_POLL_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Takes the index's writer lock, so a second worker or replica sharing
+    # SIMILARITY_INDEX_DIR fails here instead of corrupting the index
+    similarity.get_index()
+    maintenance = asyncio.create_task(partition_maintenance_loop())
+    # In the background so a large table doesn't delay startup
+    indexing = asyncio.create_task(similarity_index_loop())
+    yield
+    maintenance.cancel()
+    indexing.cancel()
+
+app = FastAPI(title="Aivoa AI CRM HCP Log Interaction", lifespan=lifespan)
 
 # CORS remains open for local development
 app.add_middleware(
@@ -32,6 +83,25 @@ class ChatRequest(BaseModel):
     message: str
     user_name: Optional[str] = None # Add user_name to ChatRequest
 
+def form_data(content: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shapes a tool result as one interaction so the frontend form can auto-fill:
+    the logged/edited interaction, or the first of a batch (with the whole batch
+    under "interactions"). Other tool results are passed through.
+    """
+    if content.get("interaction"):
+        data = dict(content["interaction"])
+    elif content.get("interactions") or content.get("extracted_data"):
+        batch = content.get("interactions") or content.get("extracted_data")
+        data = dict(batch[0])
+        if len(batch) > 1:
+            data["interactions"] = batch
+    else:
+        return content
+    if data.get("date"):
+        data["date"] = str(data["date"])[:10] # The form's date input takes YYYY-MM-DD
+    return data
+
 @app.post("/chat")
 async def chat_with_agent(request: ChatRequest, db: AsyncSession = Depends(get_db)):
     try:
@@ -39,117 +109,56 @@ async def chat_with_agent(request: ChatRequest, db: AsyncSession = Depends(get_d
         last_interaction = await crud.get_most_recent_interaction(db)
         last_interaction_id = last_interaction.id if last_interaction else None
 
-        # 1. Initialize state with DB session, last interaction ID, and user_name from request
+        # 1. Initialize state with last interaction ID and user_name from request
         initial_state = AgentState(
             messages=[HumanMessage(content=request.message)],
             interaction_data={},
             raw_user_input=request.message,
-            db_session=db,
             last_interaction_id=last_interaction_id,
             user_name=request.user_name, # Pass user_name from the request to the state
         )
 
-        # 2. Invoke Graph (using standard invoke as per your current graph setup)
-        # Note: If your graph/tools are async, use await graph.ainvoke()
-        result = graph.invoke(initial_state)
+        # 2. Invoke Graph asynchronously. The DB session travels in the config so the
+        # tools can do their own persistence, and parallel tool calls run concurrently.
+        result = await graph.ainvoke(initial_state, config={"configurable": {"db_session": db}})
 
         reply = "No reply generated."
         extracted_data = {}
+        tool_replies = []
+
+        # The extracted interactions saved before the agent ran (see save_interactions_node)
+        saved = result["interaction_data"].get("saved")
+        if saved:
+            tool_replies.append(saved["message"])
+            extracted_data = form_data(saved)
 
-        # 3. Extract tool output and AI response
+        # 3. Collect the AI response and the output of every tool call
         for msg in result["messages"]:
             if isinstance(msg, AIMessage) and msg.content and msg.content.strip():
                 reply = msg.content
             elif isinstance(msg, ToolMessage):
                 content = msg.content
+                if getattr(msg, "status", None) == "error":
+                    tool_replies.append(f"Tool {msg.name} failed: {content}")
+                    continue
                 # Handle both dict and JSON-string responses from tools
-                if isinstance(content, dict):
-                    extracted_data = content
-                elif isinstance(content, str):
+                if isinstance(content, str):
                     try:
-                        extracted_data = json.loads(content)
+                        content = json.loads(content)
                     except json.JSONDecodeError:
-                        pass # Keep current reply if string is just text
-
-        # 4. Persistence Logic for CREATE
-        if extracted_data and "hcp_name" in extracted_data:
-            try:
-                # --- Preprocessing extracted_data for date and time ---
-                if "date" in extracted_data:
-                    if extracted_data["date"] == "not specified":
-                        extracted_data["date"] = None
-                    else:
-                        # Use dateparser for robust date parsing
-                        parsed_date = dateparser.parse(extracted_data["date"])
-                        if parsed_date:
-                            extracted_data["date"] = parsed_date.strftime('%Y-%m-%d')
-                        else:
-                            # If parsing fails, set to None to avoid validation errors
-                            extracted_data["date"] = None
-                
-                if "time" in extracted_data and extracted_data["time"] == "not specified":
-                    extracted_data["time"] = None
-                
-                # --- NEW Preprocessing for interaction_type ---
-                if "interaction_type" in extracted_data and extracted_data["interaction_type"].lower() == "virtual meeting":
-                    extracted_data["interaction_type"] = "Virtual"
-                # --- End NEW Preprocessing ---
-
-                # Validation: Pydantic will ensure lowercase enums here
-                interaction_in = schemas.InteractionCreate(**extracted_data)
-                
-                # CRUD: Async save to PostgreSQL
-                new_interaction = await crud.create_interaction(db, interaction_in)
-                
-                reply = f"✅ Interaction for {extracted_data['hcp_name']} saved successfully with ID #{new_interaction.id}!"
-            except Exception as db_err:
-                print(f"DB Error: {db_err}")
-                # We still return the extracted_data so the frontend form can auto-fill
-                reply = f"Interaction extracted but failed to save: {str(db_err)}"
-        
-        # 5. Persistence Logic for EDIT
-        elif extracted_data and extracted_data.get("tool_name") == "edit_interaction":
-            try:
-                interaction_id = extracted_data["interaction_id"]
-                updates = extracted_data["updates"]
-
-                # Convert to the Pydantic schema for validation
-                update_schema = schemas.InteractionUpdate(**updates)
-
-                # Call the CRUD function to update the database
-                updated_interaction = await crud.update_interaction(db, interaction_id, update_schema)
-
-                if updated_interaction:
-                    updated_fields = ", ".join(updates.keys()) or "No changes"
-                    reply = f"✅ Interaction #{interaction_id} updated successfully! Fields changed: {updated_fields}."
-                else:
-                    reply = f"❌ Could not find interaction #{interaction_id} to update."
-
-            except Exception as db_err:
-                print(f"DB Error on update: {db_err}")
-                reply = f"Interaction edit failed to save: {str(db_err)}"
-
-        # 6. Persistence Logic for SEARCH
-        elif extracted_data and extracted_data.get("tool_name") == "search_hcp":
-            try:
-                query = extracted_data["query"]
-                found_interactions = await crud.get_interactions_by_hcp_name(db, query)
-
-                if found_interactions:
-                    reply_parts = [f"Found {len(found_interactions)} interaction(s) for '{query}':"]
-                    for interaction in found_interactions:
-                        reply_parts.append(
-                            f"- ID: {interaction.id}, HCP: {interaction.hcp_name}, Type: {interaction.interaction_type}, "
-                            f"Date: {interaction.date}, Summary: {interaction.summary or 'N/A'}"
-                        )
-                    reply = "\n".join(reply_parts)
-                else:
-                    reply = f"❌ No interactions found for '{query}'."
-            except Exception as db_err:
-                print(f"DB Error on search: {db_err}")
-                reply = f"Search for '{query}' failed: {str(db_err)}"
-
-        # 7. Handle Compliance Check Output (from ToolMessage if LLM called it)
+                        continue # Keep current reply if string is just text
+                if not isinstance(content, dict):
+                    continue
+                if saved and content.get("tool_name") == "extract_interaction_data":
+                    continue # Superseded by the saved rows, which carry their IDs
+                if content.get("message"):
+                    tool_replies.append(content["message"])
+                extracted_data = form_data(content)
+
+        if tool_replies:
+            reply = "\n\n".join(tool_replies)
+
+        # 4. Handle Compliance Check Output (from ToolMessage if LLM called it)
         # Note: If the compliance check is a mandatory node, its output might be in result["interaction_data"]
         # So we check both here.
         if "compliance_result" in result["interaction_data"]:
@@ -157,7 +166,7 @@ async def chat_with_agent(request: ChatRequest, db: AsyncSession = Depends(get_d
             # Prepend the compliance message to the reply
             reply = f"{compliance_message}\n{reply}" if reply != "No reply generated." else compliance_message
 
-        # 8. Handle set_user_name tool output
+        # 5. Handle set_user_name tool output
         elif extracted_data and extracted_data.get("tool_name") == "set_user_name":
             user_name = extracted_data["user_name"]
             reply = f"Hello {user_name}! It's nice to meet you. How can I assist you with your HCP interactions today?"
@@ -177,10 +186,19 @@ async def chat_with_agent(request: ChatRequest, db: AsyncSession = Depends(get_d
 def health():
     return {"status": "ok"}
 
+@app.get("/agent/stats")
+def agent_stats():
+    """Cumulative tool-routing telemetry: estimated schema tokens sent vs. binding every tool."""
+    return router.summary()
+
 @app.get("/interactions", response_model=list[schemas.Interaction])
-async def list_interactions(db: AsyncSession = Depends(get_db)):
-    """Retrieve all logged HCP interactions from the database."""
-    return await crud.get_interactions(db)
+async def list_interactions(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Retrieve logged HCP interactions, optionally only those dated within [date_from, date_to)."""
+    return await crud.get_interactions(db, date_from=date_from, date_to=date_to)
 
 @app.post("/interaction", response_model=schemas.Interaction)
 async def create_hcp_interaction(interaction: schemas.InteractionCreate, db: AsyncSession = Depends(get_db)):
@@ -193,3 +211,75 @@ async def create_hcp_interaction(interaction: schemas.InteractionCreate, db: Asy
         return new_interaction
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create interaction: {e}")
+
+
+@app.post("/interactions/{interaction_id}/attachments", response_model=schemas.Attachment, status_code=201)
+async def upload_attachment(
+    interaction_id: int,
+    request: Request,
+    filename: str = Query(..., max_length=255),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Streams the raw request body into the content-addressed attachment store
+    (never holding the whole file in memory) and links it to the interaction.
+    Send the file as the body with its Content-Type and `?filename=...`.
+    """
+    # Validate everything the attachments row stores before reading the body
+    filename = os.path.basename(filename)
+    content_type = request.headers.get("content-type")
+    if not filename:
+        raise HTTPException(status_code=422, detail="filename must name a file")
+    if content_type and len(content_type) > 255:
+        raise HTTPException(status_code=422, detail="Content-Type is too long")
+    if not await crud.get_interaction(db, interaction_id):
+        raise HTTPException(status_code=404, detail=f"Interaction #{interaction_id} not found")
+    try:
+        sha256, size, tmp_path = await attachments.get_store().save_stream(request.stream())
+    except attachments.AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    attachment = await crud.create_attachment(db, interaction_id, sha256, size, tmp_path, filename, content_type)
+    if not attachment:
+        # Deleted while the body was streaming
+        raise HTTPException(status_code=404, detail=f"Interaction #{interaction_id} not found")
+    return attachment
+
+@app.get("/interactions/{interaction_id}/attachments", response_model=list[schemas.Attachment])
+async def list_attachments(interaction_id: int, db: AsyncSession = Depends(get_db)):
+    """List attachment metadata for an interaction."""
+    return await crud.get_attachments_for_interaction(db, interaction_id)
+
+@app.get("/attachments/{attachment_id}")
+async def download_attachment(attachment_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Serves an attachment with HTTP Range support. FileResponse streams from disk
+    (or hands the path to the server via ASGI pathsend); with
+    ATTACHMENT_ACCEL_REDIRECT_PREFIX set, nginx serves the blob via sendfile.
+    """
+    attachment = await crud.get_attachment(db, attachment_id)
+    store = attachments.get_store()
+    if not attachment or not store.exists(attachment.sha256):
+        raise HTTPException(status_code=404, detail=f"Attachment #{attachment_id} not found")
+
+    headers = {
+        # Blobs are immutable, so the content hash is a perfect validator
+        "etag": f'"{attachment.sha256}"',
+        "cache-control": "private, max-age=31536000, immutable",
+    }
+    media_type = attachment.content_type or "application/octet-stream"
+    if attachments.ACCEL_REDIRECT_PREFIX:
+        headers["x-accel-redirect"] = attachments.ACCEL_REDIRECT_PREFIX + store.relative_path(attachment.sha256)
+        headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(attachment.filename)}"
+        return Response(headers=headers, media_type=media_type)
+    return FileResponse(
+        store.path(attachment.sha256),
+        media_type=media_type,
+        filename=attachment.filename,
+        headers=headers,
+    )
+
+@app.delete("/attachments/{attachment_id}", status_code=204)
+async def delete_attachment(attachment_id: int, db: AsyncSession = Depends(get_db)):
+    """Delete an attachment; its blob is removed once no other attachment shares it."""
+    if not await crud.delete_attachment(db, attachment_id):
+        raise HTTPException(status_code=404, detail=f"Attachment #{attachment_id} not found")
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import sys
+import os
+from datetime import date
+
+# Ensure the app directory is in path if running from backend folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app import migrations, partitions
+
+
+async def main(args):
+    if args.command == "upgrade":
+        applied = await migrations.upgrade(engine)
+        print(f"🚀 Applied migrations: {', '.join(applied)}" if applied else "Schema is up to date.")
+    elif args.command == "status":
+        applied = set(await migrations.applied_versions(engine))
+        for migration in migrations.MIGRATIONS:
+            mark = "x" if migration.VERSION in applied else " "
+            print(f"[{mark}] {migration.VERSION} {migration.DESCRIPTION}")
+    elif args.command == "partitions":
+        created = await partitions.maintain_partitions(engine, months_ahead=args.months_ahead)
+        print(f"Created partitions: {', '.join(created)}" if created else "Partitions are up to date.")
+    elif args.command == "archive":
+        cutoff = partitions.add_months(partitions.month_start(date.today()), -args.older_than_months)
+        archived = await partitions.archive_partitions(engine, cutoff, args.export_dir, drop=not args.keep)
+        print(f"Archived partitions: {', '.join(archived)}" if archived else f"No partitions older than {cutoff} archived.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schema migrations and partition maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("upgrade", help="apply pending migrations")
+    sub.add_parser("status", help="list migrations and whether they are applied")
+    p = sub.add_parser("partitions", help="create upcoming monthly partitions")
+    p.add_argument("--months-ahead", type=int, default=partitions.MONTHS_AHEAD)
+    a = sub.add_parser("archive", help="detach, export and drop old monthly partitions")
+    a.add_argument("--older-than-months", type=int, required=True)
+    a.add_argument("--export-dir", default="archive")
+    a.add_argument("--keep", action="store_true", help="keep the detached table instead of dropping it")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+# backend/app/migrations/__init__.py
+"""
+Minimal forward-only migration runner.
+
+Each migration module defines VERSION, DESCRIPTION and `async def upgrade(engine)`.
+Migrations receive the engine rather than a transaction so they can manage their
+own transactions (batched backfills) or run outside one (concurrent index builds).
+Applied versions are recorded in `schema_migrations`; a Postgres advisory lock
+keeps two runners from migrating at the same time.
+"""
+from typing import List
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import m0001_partition_interactions, m0002_interactions_date_index, m0003_attachments
+
+MIGRATIONS = [
+    m0001_partition_interactions,
+    m0002_interactions_date_index,
+    m0003_attachments,
+]
+
+_LOCK_KEY = 0x6863705f6d6967  # arbitrary constant shared by all runners
+
+
+async def _ensure_table(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.execute(sa.text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(32) PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            )
+        """))
+
+
+async def applied_versions(engine: AsyncEngine) -> List[str]:
+    await _ensure_table(engine)
+    async with engine.connect() as conn:
+        result = await conn.execute(sa.text("SELECT version FROM schema_migrations ORDER BY version"))
+        return list(result.scalars().all())
+
+
+async def _record(engine: AsyncEngine, migration):
+    async with engine.begin() as conn:
+        await conn.execute(
+            sa.text("""
+                INSERT INTO schema_migrations (version, description) VALUES (:version, :description)
+                ON CONFLICT (version) DO NOTHING
+            """),
+            {"version": migration.VERSION, "description": migration.DESCRIPTION},
+        )
+
+
+async def upgrade(engine: AsyncEngine) -> List[str]:
+    """Applies pending migrations in order. Returns the versions applied."""
+    done = set(await applied_versions(engine))
+    applied = []
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(sa.text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+        try:
+            # Another runner may have finished while we waited for the lock
+            done |= set(await applied_versions(engine))
+            for migration in MIGRATIONS:
+                if migration.VERSION in done:
+                    continue
+                print(f"Applying migration {migration.VERSION}: {migration.DESCRIPTION}")
+                await migration.upgrade(engine)
+                await _record(engine, migration)
+                applied.append(migration.VERSION)
+        finally:
+            await lock_conn.execute(sa.text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+    return applied
+
+
+async def stamp_head(engine: AsyncEngine):
+    """Marks every migration as applied, for databases created straight from the models."""
+    await _ensure_table(engine)
+    for migration in MIGRATIONS:
+        await _record(engine, migration)
@@ -0,0 +1,113 @@
+# backend/app/migrations/m0001_partition_interactions.py
+"""
+Converts hcp_interactions into a table range-partitioned by month on `date`.
+
+Online strategy: build a partitioned copy and install a trigger that records
+the id of every row inserted, updated or deleted from then on. Backfill the
+copy in batches while the old table keeps serving traffic, then take a brief
+exclusive lock, re-copy the recorded ids from the old table and swap the
+names. The old table is kept as hcp_interactions_legacy for verification and
+can be dropped afterwards.
+"""
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..database import Base
+from .. import models  # noqa: F401  (Base needs to see the models)
+from ..partitions import TABLE, ensure_partitions, is_partitioned
+from .online import backfill_in_batches
+
+VERSION = "0001"
+DESCRIPTION = "Range-partition hcp_interactions by month on date"
+
+NEW_TABLE = f"{TABLE}_new"
+LEGACY_TABLE = f"{TABLE}_legacy"
+CHANGES_TABLE = f"{TABLE}_changes"
+CAPTURE_FUNCTION = f"{TABLE}_capture_change"
+CAPTURE_TRIGGER = f"{TABLE}_capture_change"
+# Indexes declared on the model, other than the date index added by 0002
+INDEXED_COLUMNS = ("id", "hcp_name")
+
+
+async def upgrade(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        exists = (await conn.execute(sa.text("SELECT to_regclass(:t)"), {"t": TABLE})).scalar()
+        if not exists:
+            # Fresh database: create everything straight from the models
+            await conn.run_sync(Base.metadata.create_all)
+            await ensure_partitions(conn)
+            return
+        if await is_partitioned(conn):
+            return
+
+        oldest = (await conn.execute(sa.text(f"SELECT min(date) FROM {TABLE}"))).scalar()
+        await conn.execute(sa.text(f"DROP TABLE IF EXISTS {NEW_TABLE} CASCADE"))
+        # INCLUDING DEFAULTS keeps id's nextval() on the existing sequence
+        await conn.execute(sa.text(f"""
+            CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS)
+            PARTITION BY RANGE (date)
+        """))
+        await conn.execute(sa.text(
+            f"ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY (id, date)"
+        ))
+        for column in INDEXED_COLUMNS:
+            await conn.execute(sa.text(f"CREATE INDEX ix_{NEW_TABLE}_{column} ON {NEW_TABLE} ({column})"))
+        await ensure_partitions(conn, parent=NEW_TABLE, since=oldest.date() if oldest else None)
+        await _install_change_capture(conn)
+
+    # Every write committed from here on is recorded in CHANGES_TABLE: CREATE TRIGGER
+    # waited for in-flight writers, and each backfill batch starts a later snapshot
+    await backfill_in_batches(
+        engine,
+        f"INSERT INTO {NEW_TABLE} SELECT * FROM {TABLE} WHERE id >= :lo AND id < :hi ON CONFLICT DO NOTHING",
+        source_table=TABLE,
+    )
+
+    async with engine.begin() as conn:
+        await conn.execute(sa.text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        # Replay rows touched since the trigger went in: whatever the backfill copied
+        # for them (an old version, or a row since deleted) is replaced by the current
+        # state, and rows inserted after their batch was read are added
+        await conn.execute(sa.text(f"DELETE FROM {NEW_TABLE} WHERE id IN (SELECT id FROM {CHANGES_TABLE})"))
+        await conn.execute(
+            sa.text(f"INSERT INTO {NEW_TABLE} SELECT * FROM {TABLE} WHERE id IN (SELECT id FROM {CHANGES_TABLE})")
+        )
+        await _drop_change_capture(conn)
+
+        await conn.execute(sa.text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}"))
+        await conn.execute(sa.text(f"ALTER INDEX {TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey"))
+        await conn.execute(sa.text(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}"))
+        await conn.execute(sa.text(f"ALTER INDEX {NEW_TABLE}_pkey RENAME TO {TABLE}_pkey"))
+        for column in INDEXED_COLUMNS:
+            await conn.execute(sa.text(f"ALTER INDEX ix_{TABLE}_{column} RENAME TO ix_{LEGACY_TABLE}_{column}"))
+            await conn.execute(sa.text(f"ALTER INDEX ix_{NEW_TABLE}_{column} RENAME TO ix_{TABLE}_{column}"))
+        await conn.execute(sa.text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id"))
+    print(f"Swapped in partitioned {TABLE}; previous table kept as {LEGACY_TABLE}")
+
+
+async def _install_change_capture(conn):
+    await _drop_change_capture(conn)  # leftovers from an interrupted run
+    await conn.execute(sa.text(f"CREATE UNLOGGED TABLE {CHANGES_TABLE} (id integer NOT NULL)"))
+    await conn.execute(sa.text(f"""
+        CREATE FUNCTION {CAPTURE_FUNCTION}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                INSERT INTO {CHANGES_TABLE} VALUES (OLD.id);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {CHANGES_TABLE} VALUES (NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    await conn.execute(sa.text(f"""
+        CREATE TRIGGER {CAPTURE_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {CAPTURE_FUNCTION}()
+    """))
+
+
+async def _drop_change_capture(conn):
+    await conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {CAPTURE_TRIGGER} ON {TABLE}"))
+    await conn.execute(sa.text(f"DROP FUNCTION IF EXISTS {CAPTURE_FUNCTION}()"))
+    await conn.execute(sa.text(f"DROP TABLE IF EXISTS {CHANGES_TABLE}"))
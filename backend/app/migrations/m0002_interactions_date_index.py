@@ -0,0 +1,13 @@
+# backend/app/migrations/m0002_interactions_date_index.py
+"""Index hcp_interactions.date for ordered/range scans within a partition."""
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..partitions import TABLE
+from .online import create_index_concurrently
+
+VERSION = "0002"
+DESCRIPTION = "Add ix_hcp_interactions_date concurrently"
+
+
+async def upgrade(engine: AsyncEngine):
+    await create_index_concurrently(engine, f"ix_{TABLE}_date", TABLE, ["date"])
@@ -0,0 +1,14 @@
+# backend/app/migrations/m0003_attachments.py
+"""Metadata table for content-addressed interaction attachments."""
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .. import models
+
+VERSION = "0003"
+DESCRIPTION = "Create attachments table"
+
+
+async def upgrade(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        # New and empty, so a plain CREATE TABLE (and its indexes) is instant
+        await conn.run_sync(models.Attachment.__table__.create, checkfirst=True)
@@ -0,0 +1,82 @@
+# backend/app/migrations/online.py
+"""
+Helpers for schema changes that must not block writes for long: concurrent
+index builds (including on partitioned tables) and batched backfills that
+commit between batches.
+"""
+import asyncio
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..partitions import is_partitioned
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+async def create_index_concurrently(engine: AsyncEngine, name: str, table: str, columns: Sequence[str]):
+    """
+    CREATE INDEX CONCURRENTLY, which Postgres does not support on a partitioned
+    parent. For those the parent index is created ON ONLY the parent (invalid,
+    instant), each partition is indexed concurrently, and the partition indexes
+    are attached, after which the parent index becomes valid.
+    """
+    cols = ", ".join(columns)
+    # CONCURRENTLY cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not await is_partitioned(conn, table):
+            await conn.execute(sa.text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+            return
+
+        await conn.execute(sa.text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} ({cols})"))
+        result = await conn.execute(
+            sa.text("""
+                SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(:table)
+            """),
+            {"table": table},
+        )
+        for partition in result.scalars().all():
+            partition_index = f"{partition}_{'_'.join(columns)}_idx"
+            await conn.execute(
+                sa.text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} ({cols})")
+            )
+            await conn.execute(sa.text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+        print(f"Built index {name} on {table} and its partitions concurrently")
+
+
+async def backfill_in_batches(
+    engine: AsyncEngine,
+    statement: str,
+    source_table: str,
+    key: str = "id",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    pause: float = 0.0,
+) -> Optional[int]:
+    """
+    Runs `statement` once per `key` range [:lo, :hi) of `source_table`, each batch
+    in its own short transaction so row locks are held only briefly. Returns the
+    highest key value covered, or None if the table was empty.
+    """
+    async with engine.connect() as conn:
+        result = await conn.execute(sa.text(f"SELECT min({key}), max({key}) FROM {source_table}"))
+        low, high = result.one()
+    if low is None:
+        return None
+    low = low if start is None else start
+    high = high if stop is None else stop
+
+    done = 0
+    for lo in range(low, high + 1, batch_size):
+        hi = min(lo + batch_size, high + 1)
+        async with engine.begin() as conn:
+            result = await conn.execute(sa.text(statement), {"lo": lo, "hi": hi})
+        done += max(result.rowcount, 0)
+        print(f"Backfill {source_table}: {key} < {hi} of {high} ({done} rows)")
+        if pause:
+            await asyncio.sleep(pause)
+    return high
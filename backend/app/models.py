@@ -1,5 +1,5 @@
 # backend/app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Enum, Index, PrimaryKeyConstraint
 from sqlalchemy.sql import func
 from .database import Base
 import enum
@@ -18,8 +18,16 @@ class OutcomeType(enum.Enum):
 
 class Interaction(Base):
     __tablename__ = "hcp_interactions"  # table name in DB
+    # Range-partitioned by month on `date` (see partitions.py). Postgres requires the
+    # partition key in the primary key, so the DB key is (id, date) while the ORM
+    # still identifies rows by id alone.
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "date", name="hcp_interactions_pkey"),
+        Index("ix_hcp_interactions_date", "date"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, autoincrement=True, index=True)
     hcp_name = Column(String(255), index=True, nullable=False)
     attendees = Column(Text) # e.g. "Dr. Smith, Dr. Jones"
     date = Column(DateTime, nullable=False)
@@ -32,4 +40,20 @@ class Interaction(Base):
     follow_up = Column(Text)  # e.g. "Send samples next week"
     summary = Column(Text)  # LLM-generated summary
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __mapper_args__ = {"primary_key": [id]}
+
+
+class Attachment(Base):
+    __tablename__ = "attachments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # No foreign key: hcp_interactions is keyed by (id, date) because of partitioning,
+    # so the link is checked in crud and cleaned up when the interaction is deleted
+    interaction_id = Column(Integer, index=True, nullable=False)
+    sha256 = Column(String(64), index=True, nullable=False)  # blob key in the attachment store
+    size = Column(BigInteger, nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
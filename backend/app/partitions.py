@@ -0,0 +1,291 @@
+# backend/app/partitions.py
+"""
+Monthly range partitions of `hcp_interactions` by `date`.
+
+The parent table is declared `PARTITION BY RANGE (date)` in models.py. Rows
+whose month has no partition yet land in `hcp_interactions_default`; creating
+a month's partition moves those rows out of the default partition before
+attaching it, so partitions can be added at any time. Periodic maintenance
+creates partitions for any month found in the default partition, so it only
+ever holds rows briefly.
+"""
+import csv
+import os
+import shutil
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from . import attachments, crud, similarity
+
+TABLE = "hcp_interactions"
+DEFAULT_PARTITION = f"{TABLE}_default"
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+ARCHIVE_BATCH_SIZE = 5000
+ATTACHMENT_COLUMNS = ("id", "interaction_id", "sha256", "size", "filename", "content_type", "created_at")
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+async def is_partitioned(conn: AsyncConnection, table: str = TABLE) -> bool:
+    # Compared in SQL: asyncpg returns the "char" relkind as bytes
+    result = await conn.execute(
+        sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    )
+    return bool(result.scalar())
+
+
+async def list_partitions(conn: AsyncConnection, parent: str = TABLE) -> List[Tuple[str, Optional[date], Optional[date]]]:
+    """Returns (name, lower bound, upper bound) for each monthly partition; default partition excluded."""
+    result = await conn.execute(
+        sa.text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:parent)
+            ORDER BY c.relname
+        """),
+        {"parent": parent},
+    )
+    partitions = []
+    for name, bound in result.all():
+        if bound == "DEFAULT":
+            continue
+        # e.g. FOR VALUES FROM ('2026-10-01 00:00:00') TO ('2026-11-01 00:00:00')
+        lower, upper = (datetime.fromisoformat(part.split("'")[1]).date() for part in bound.split(" TO "))
+        partitions.append((name, lower, upper))
+    return partitions
+
+
+async def create_partition(conn: AsyncConnection, month: date, parent: str = TABLE, adopt: bool = False):
+    """
+    Creates and attaches the partition for `month`, moving any of its rows out of
+    the default partition first (ATTACH fails if the default still holds them).
+    With `adopt`, the table already exists (left detached by an archive run) and
+    is attached instead of created. Must run inside a transaction.
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    if not adopt:
+        await conn.execute(sa.text(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    await conn.execute(
+        sa.text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE date >= :lower AND date < :upper RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """),
+        # asyncpg binds dates, not ISO strings
+        {"lower": month, "upper": add_months(month, 1)},
+    )
+    await conn.execute(
+        sa.text(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    )
+    print(f"{'Re-attached' if adopt else 'Created'} partition {name} [{lower}, {upper})")
+
+
+async def ensure_partitions(
+    conn: AsyncConnection,
+    parent: str = TABLE,
+    months_ahead: int = MONTHS_AHEAD,
+    since: Optional[date] = None,
+) -> List[str]:
+    """
+    Makes sure the default partition and one partition per month from `since`
+    (default: the current month) through `months_ahead` months ahead exist,
+    plus a partition for every month that has rows sitting in the default
+    partition (back-dated or far-future interactions). A month whose table an
+    archive run left detached gets that table re-attached rather than a new one.
+    Returns the names of partitions that were created or re-attached.
+    """
+    await conn.execute(sa.text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT"))
+
+    existing = {name for name, _, _ in await list_partitions(conn, parent)}
+    detached = {name for name, _ in await list_detached_partitions(conn)} if parent == TABLE else set()
+    month = month_start(since or date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    months = set()
+    while month <= last:
+        months.add(month)
+        month = add_months(month, 1)
+    result = await conn.execute(
+        sa.text(f"SELECT DISTINCT date_trunc('month', date)::date FROM {DEFAULT_PARTITION} WHERE date IS NOT NULL")
+    )
+    months.update(result.scalars())
+
+    created = []
+    for month in sorted(months):
+        if partition_name(month) not in existing:
+            await create_partition(conn, month, parent, adopt=partition_name(month) in detached)
+            created.append(partition_name(month))
+    return created
+
+
+async def maintain_partitions(engine: AsyncEngine, months_ahead: int = MONTHS_AHEAD) -> List[str]:
+    """
+    Creates upcoming partitions and drains the default partition into monthly
+    ones; a no-op if the table has not been migrated to partitions yet.
+    """
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            print(f"{TABLE} is not partitioned yet; run `python -m app.migrate upgrade`.")
+            return []
+        return await ensure_partitions(conn, months_ahead=months_ahead)
+
+
+async def list_detached_partitions(conn: AsyncConnection) -> List[Tuple[str, date]]:
+    """
+    Returns (name, month) for monthly tables left detached by an interrupted
+    archive run (detached but not yet exported and dropped).
+    """
+    result = await conn.execute(
+        sa.text("""
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND pg_table_is_visible(oid) AND relname ~ :pattern
+            ORDER BY relname
+        """),
+        {"pattern": f"^{TABLE}_y[0-9]{{4}}m[0-9]{{2}}$"},
+    )
+    detached = []
+    for name in result.scalars():
+        year, month = name[len(TABLE) + 2:].split("m")
+        detached.append((name, date(int(year), int(month), 1)))
+    return detached
+
+
+async def _export_partition(engine: AsyncEngine, name: str, path: str) -> List[int]:
+    """Copies a detached partition to CSV and returns the ids it held."""
+    # Write under a temporary name so a failed COPY never leaves a complete-looking file
+    tmp_path = path + ".part"
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_from_table(name, output=tmp_path, format="csv", header=True)
+        ids = (await conn.execute(sa.text(f"SELECT id FROM {name}"))).scalars().all()
+    os.replace(tmp_path, path)
+    return ids
+
+
+async def _archive_attachments(
+    engine: AsyncEngine, ids: List[int], export_dir: str, prefix: str, delete: bool = True
+) -> int:
+    """
+    Exports the attachments of archived interactions (metadata CSV plus a copy of
+    each blob under `export_dir`/attachments) and, with `delete`, deletes them,
+    removing blobs no remaining attachment shares. Returns the number of attachments.
+    """
+    store = attachments.get_store()
+    batches = [ids[i:i + ARCHIVE_BATCH_SIZE] for i in range(0, len(ids), ARCHIVE_BATCH_SIZE)]
+    async with AsyncSession(engine) as db:
+        rows = []
+        for batch in batches:
+            rows.extend(await crud.get_attachments_for_interactions(db, batch))
+        if not rows:
+            return 0
+
+        for attachment in rows:
+            target = os.path.join(export_dir, "attachments", store.relative_path(attachment.sha256))
+            if store.exists(attachment.sha256) and not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(store.path(attachment.sha256), target)
+        with open(os.path.join(export_dir, f"{prefix}_attachments.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(ATTACHMENT_COLUMNS)
+            for attachment in rows:
+                writer.writerow([getattr(attachment, column) for column in ATTACHMENT_COLUMNS])
+
+        if delete:
+            for batch in batches:
+                await crud.delete_attachments_for_interactions(db, batch)
+    return len(rows)
+
+
+async def _archive_partition(
+    engine: AsyncEngine, name: str, lower: Optional[date], upper: Optional[date], export_dir: str, drop: bool
+):
+    """Archives one partition; `lower` is None for a table that is already detached."""
+    if lower is not None:
+        # DETACH ... CONCURRENTLY is not allowed while a default partition exists, so keep
+        # the exclusive lock short and give up rather than queue behind long queries
+        async with engine.begin() as conn:
+            await conn.execute(sa.text("SET LOCAL lock_timeout = '5s'"))
+            await conn.execute(sa.text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+
+    # Timestamped so a month archived again (after back-dated rows) keeps both exports
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(export_dir, f"{name}_{stamp}.csv")
+    try:
+        ids = await _export_partition(engine, name, path)
+    except BaseException:
+        if lower is not None:
+            await _reattach_partition(engine, name, lower, upper)
+        raise
+
+    # Before the drop, so a failure leaves the table for the next run to retry. A kept
+    # table keeps its interactions' attachments too.
+    attached = await _archive_attachments(engine, ids, export_dir, f"{name}_{stamp}", delete=drop)
+
+    async with engine.begin() as conn:
+        if drop:
+            await conn.execute(sa.text(f"DROP TABLE {name}"))
+        else:
+            # Renamed so later runs don't treat it as a leftover and export it again
+            await conn.execute(sa.text(f"ALTER TABLE {name} RENAME TO {name}_{stamp.lower()}"))
+    print(f"Archived partition {name} ({len(ids)} rows, {attached} attachment(s)) to {path}")
+
+
+async def archive_partitions(engine: AsyncEngine, older_than: date, export_dir: str, drop: bool = True) -> List[str]:
+    """
+    Detaches every monthly partition that ends on or before `older_than`, exports
+    it and its interactions' attachments to `export_dir` and then drops it (or,
+    with drop=False, renames it out of the way). If the export fails the
+    partition is re-attached; one that cannot be is left detached and picked up
+    by the next run (or re-attached by partition maintenance), as are tables an
+    interrupted run left behind. A partition that fails is reported and skipped.
+    The API is asked to rebuild its similarity index afterwards. Returns the
+    archived partition names.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    async with engine.connect() as conn:
+        old = [(name, lower, upper) for name, lower, upper in await list_partitions(conn) if upper <= older_than]
+        leftovers = [
+            (name, None, None) for name, month in await list_detached_partitions(conn)
+            if add_months(month, 1) <= older_than
+        ]
+
+    archived = []
+    for name, lower, upper in leftovers + old:
+        try:
+            await _archive_partition(engine, name, lower, upper, export_dir, drop)
+        except Exception as e:
+            # One month that keeps failing must not hold up the others
+            print(f"Archiving {name} failed: {e}")
+            continue
+        archived.append(name)
+    if archived:
+        # The index belongs to the API process; ask it to drop the archived rows
+        similarity.request_rebuild()
+    return archived
+
+
+async def _reattach_partition(engine: AsyncEngine, name: str, lower: date, upper: date):
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(sa.text("SET LOCAL lock_timeout = '5s'"))
+            await conn.execute(
+                sa.text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+            )
+        print(f"Export of {name} failed; partition re-attached")
+    except Exception as e:
+        print(f"Export of {name} failed and it could not be re-attached ({e}); the next archive run will retry it")
@@ -51,4 +51,17 @@ class Interaction(InteractionBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True  # Allows ORM mode (SQLAlchemy → Pydantic)
\ No newline at end of file
+        from_attributes = True  # Allows ORM mode (SQLAlchemy → Pydantic)
+
+
+class Attachment(BaseModel):
+    id: int
+    interaction_id: int
+    sha256: str
+    size: int
+    filename: str
+    content_type: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
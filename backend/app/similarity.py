@@ -0,0 +1,441 @@
+# backend/app/similarity.py
+"""
+Offline similarity index for "similar past interactions" retrieval.
+
+Interactions are embedded locally (no network) with signed feature hashing of
+word unigrams/bigrams and character trigrams over `topics`, `summary` and
+`follow_up`. Vectors are L2-normalised float32 rows stored in a memory-mapped
+matrix on disk, so cosine similarity is a plain dot product and a top-k query
+is one matrix-vector product per chunk of rows.
+
+The API process is the index's only writer: the memmap metadata and the
+id -> row map are held in memory there. Opening the index takes an exclusive
+flock on `writer.lock`, so a second process (another uvicorn worker or replica
+sharing SIMILARITY_INDEX_DIR) fails instead of corrupting it. Other processes
+(the migrate CLI, init_db) never open the index; they call `request_rebuild()`,
+and the API rebuilds the index from the database when it notices the request.
+
+Each build lives in its own generation directory and `CURRENT` names the one
+being served. A rebuild fills a fresh generation while searches keep using the
+old one, then swaps `CURRENT`. Live writes made during a rebuild go to both
+indexes, and the rebuild skips the ids they touched, so a batch read before an
+update cannot overwrite the newer vector.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the single-writer check is skipped
+    fcntl = None
+
+INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "similarity_index")
+EMBEDDING_DIM = 128          # power of two; 512 bytes/row keeps a 1M-row scan memory-bandwidth cheap
+SEARCH_CHUNK_ROWS = 1 << 16  # rows scored per matmul; bounds temporary memory
+_INITIAL_CAPACITY = 1024
+_EMPTY_ID = -1
+REBUILD_MARKER = "rebuild.requested"
+WRITER_LOCK = "writer.lock"
+CURRENT_POINTER = "CURRENT"
+_GENERATION_PREFIX = "gen-"
+# Files of the single-directory layout used before generations
+_LEGACY_FILES = ("vectors.f32", "ids.i64", "meta.json", "meta.json.tmp")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+TEXT_FIELDS = ("topics", "summary", "follow_up")
+
+
+def interaction_text(interaction: Any) -> str:
+    """Joins the free-text fields of an ORM object or dict used for similarity."""
+    if isinstance(interaction, dict):
+        parts = [interaction.get(field) for field in TEXT_FIELDS]
+    else:
+        parts = [getattr(interaction, field, None) for field in TEXT_FIELDS]
+    return " ".join(p for p in parts if p)
+
+
+def _features(text: str) -> Iterable[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    for token in tokens:
+        yield token
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            yield "#" + padded[i:i + 3]
+    for first, second in zip(tokens, tokens[1:]):
+        yield first + " " + second
+
+
+def embed(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Hashes text into an L2-normalised float32 vector (all zeros for empty text)."""
+    counts: Dict[int, float] = {}
+    for feature in _features(text):
+        # crc32 is stable across processes, unlike the builtin hash()
+        h = zlib.crc32(feature.encode("utf-8"))
+        bucket = h & (dim - 1)
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        counts[bucket] = counts.get(bucket, 0.0) + sign
+
+    vector = np.zeros(dim, dtype=np.float32)
+    if counts:
+        buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        # Sublinear term frequency so repeated words don't dominate the vector
+        vector[buckets] = np.sign(values) * np.log1p(np.abs(values))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+    return vector
+
+
+def embed_batch(texts: Sequence[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embeds several texts into a (len(texts), dim) float32 matrix."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row] = embed(text, dim)
+    return matrix
+
+
+class SimilarityIndex:
+    """
+    Append-mostly float32 matrix of interaction embeddings backed by memmap files.
+
+    Rows are addressed through an in-memory interaction_id -> row map rebuilt
+    from `ids.i64` on open. Updates overwrite the row in place, deletes blank the
+    row's id so searches skip it. Capacity doubles when the matrix is full.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._ids_path = os.path.join(directory, "ids.i64")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._open()
+
+    # --- storage -----------------------------------------------------------
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {"dim": self.dim, "count": 0, "capacity": _INITIAL_CAPACITY}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                raise ValueError(
+                    f"Similarity index at {self.directory} has dim {meta['dim']}, expected {self.dim}"
+                )
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+        self._map_files()
+        self._row_of = {
+            int(interaction_id): row
+            for row, interaction_id in enumerate(self._ids[:self.count])
+            if interaction_id != _EMPTY_ID
+        }
+
+    def _map_files(self):
+        for path, itemsize in ((self._vectors_path, 4 * self.dim), (self._ids_path, 8)):
+            size = self.capacity * itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        self._ids = np.memmap(self._ids_path, dtype=np.int64, mode="r+", shape=(self.capacity,))
+        # Fresh (zero-filled) slots past `count` must read as empty, not as id 0
+        self._ids[self.count:] = _EMPTY_ID
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _grow(self, needed: int):
+        new_capacity = self.capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        if new_capacity == self.capacity:
+            return
+        self.flush()
+        del self._vectors, self._ids
+        self.capacity = new_capacity
+        self._map_files()
+
+    def flush(self):
+        self._vectors.flush()
+        self._ids.flush()
+        self._write_meta()
+
+    # --- updates -----------------------------------------------------------
+
+    def upsert_many(self, items: Sequence[Tuple[int, str]]):
+        """Adds or replaces the embeddings for (interaction_id, text) pairs."""
+        if not items:
+            return
+        self.upsert_vectors([interaction_id for interaction_id, _ in items], embed_batch([text for _, text in items], self.dim))
+
+    def upsert_vectors(self, interaction_ids: Sequence[int], vectors: np.ndarray):
+        """Adds or replaces already embedded rows."""
+        if not len(interaction_ids):
+            return
+        with self._lock:
+            new_ids = {interaction_id for interaction_id in interaction_ids if interaction_id not in self._row_of}
+            self._grow(self.count + len(new_ids))
+            for interaction_id, vector in zip(interaction_ids, vectors):
+                row = self._row_of.get(interaction_id)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self._row_of[interaction_id] = row
+                    self._ids[row] = interaction_id
+                self._vectors[row] = vector
+            self.flush()
+
+    def upsert(self, interaction_id: int, text: str):
+        self.upsert_many([(interaction_id, text)])
+
+    def remove_many(self, interaction_ids: Iterable[int]):
+        with self._lock:
+            rows = [self._row_of.pop(int(i)) for i in interaction_ids if int(i) in self._row_of]
+            if not rows:
+                return
+            self._ids[rows] = _EMPTY_ID
+            self._vectors[rows] = 0.0
+            self.flush()
+
+    def remove(self, interaction_id: int):
+        self.remove_many([interaction_id])
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # --- search ------------------------------------------------------------
+
+    def search_batch(self, queries: Sequence[str], k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        Returns, for each query, up to `k` (interaction_id, cosine score) pairs
+        ordered by descending score. Rows are scored in chunks so the temporary
+        score matrix stays at SEARCH_CHUNK_ROWS x len(queries).
+        """
+        if not queries:
+            return []
+        if k <= 0:
+            return [[] for _ in queries]
+        q = embed_batch(queries, self.dim)            # (B, dim)
+        batch = q.shape[0]
+        best_scores = np.full((batch, 0), -np.inf, dtype=np.float32)
+        best_ids = np.empty((batch, 0), dtype=np.int64)
+
+        with self._lock:
+            count = self.count
+            for start in range(0, count, SEARCH_CHUNK_ROWS):
+                stop = min(start + SEARCH_CHUNK_ROWS, count)
+                ids = np.asarray(self._ids[start:stop])
+                # (rows, dim) @ (dim, B) streams the row-major chunk once; transposing
+                # the small result is cheaper than transposing the chunk
+                scores = (np.asarray(self._vectors[start:stop]) @ q.T).T  # (B, rows)
+                scores[:, ids == _EMPTY_ID] = -np.inf
+
+                take = min(k, stop - start)
+                top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+                best_ids = np.concatenate([best_ids, ids[top]], axis=1)
+
+                if best_scores.shape[1] > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_ids = np.take_along_axis(best_ids, keep, axis=1)
+
+        results = []
+        for scores_row, ids_row in zip(best_scores, best_ids):
+            order = np.argsort(-scores_row)
+            results.append([
+                (int(ids_row[i]), float(scores_row[i]))
+                for i in order
+                if np.isfinite(scores_row[i]) and scores_row[i] > 0
+            ])
+        return results
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        return self.search_batch([query], k)[0]
+
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+_writer_lock_file = None
+# Serialises live writes with rebuild batches and the generation swap
+_write_lock = threading.Lock()
+_rebuild: Optional["Rebuild"] = None
+
+
+def _acquire_writer(directory: str):
+    """Takes the writer flock for `directory` for the life of this process."""
+    global _writer_lock_file
+    if fcntl is None or _writer_lock_file is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, WRITER_LOCK), "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.seek(0)
+        holder = lock_file.read().strip() or "unknown"
+        lock_file.close()
+        raise RuntimeError(
+            f"Similarity index at {directory} is already open in another process (pid {holder}); "
+            "run the API as a single process per SIMILARITY_INDEX_DIR"
+        )
+    lock_file.truncate(0)
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    _writer_lock_file = lock_file
+
+
+def _current_generation(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(os.path.join(directory, name)) else None
+
+
+def _new_generation(directory: str) -> SimilarityIndex:
+    return SimilarityIndex(os.path.join(directory, f"{_GENERATION_PREFIX}{time.time_ns()}"))
+
+
+def _set_current(directory: str, index: SimilarityIndex):
+    index.flush()
+    tmp_path = os.path.join(directory, CURRENT_POINTER + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(os.path.basename(index.directory))
+    os.replace(tmp_path, os.path.join(directory, CURRENT_POINTER))
+
+
+def _remove_stale_generations(directory: str, keep: SimilarityIndex):
+    """Deletes generations other than `keep` and files of the legacy layout."""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(_GENERATION_PREFIX) and path != keep.directory:
+            # Searches still holding the old generation keep their memmaps after the unlink
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in _LEGACY_FILES:
+            os.remove(path)
+
+
+def get_index() -> SimilarityIndex:
+    """
+    Returns the process-wide index, opening (or creating) it on first use. Raises
+    RuntimeError when another process already holds the index.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _acquire_writer(INDEX_DIR)
+                current = _current_generation(INDEX_DIR)
+                if current is None:
+                    index = _new_generation(INDEX_DIR)
+                    _set_current(INDEX_DIR, index)
+                else:
+                    index = SimilarityIndex(os.path.join(INDEX_DIR, current))
+                _index = index
+    return _index
+
+
+class Rebuild:
+    """A fresh generation being filled from the database while the current one serves searches."""
+
+    def __init__(self):
+        self.index = _new_generation(INDEX_DIR)
+        # Ids written live since the rebuild started; their vectors in `index` are newer than any batch
+        self.touched: set = set()
+
+    def add(self, items: Sequence[Tuple[int, str]]):
+        """Embeds a batch read from the database, skipping ids written live meanwhile."""
+        vectors = embed_batch([text for _, text in items], self.index.dim)
+        with _write_lock:
+            keep = [row for row, (interaction_id, _) in enumerate(items) if interaction_id not in self.touched]
+            self.index.upsert_vectors([items[row][0] for row in keep], vectors[keep])
+
+
+def begin_rebuild() -> Rebuild:
+    """Starts filling a fresh generation; finish with `finish_rebuild` or `abort_rebuild`."""
+    global _rebuild
+    get_index()
+    with _write_lock:
+        if _rebuild is not None:
+            raise RuntimeError("A similarity index rebuild is already running")
+        _rebuild = Rebuild()
+        return _rebuild
+
+
+def finish_rebuild(rebuild: Rebuild):
+    """Makes the rebuilt generation current and deletes the old one."""
+    global _index, _rebuild
+    with _write_lock:
+        _set_current(INDEX_DIR, rebuild.index)
+        with _index_lock:
+            _index = rebuild.index
+        _rebuild = None
+    _remove_stale_generations(INDEX_DIR, rebuild.index)
+
+
+def abort_rebuild(rebuild: Rebuild):
+    global _rebuild
+    with _write_lock:
+        if _rebuild is rebuild:
+            _rebuild = None
+    shutil.rmtree(rebuild.index.directory, ignore_errors=True)
+
+
+def request_rebuild(directory: str = INDEX_DIR):
+    """Asks the API process to rebuild the index from the database. Safe from any process."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, REBUILD_MARKER), "w") as f:
+        f.write(f"{os.getpid()}\n")
+
+
+def take_rebuild_request(directory: str = INDEX_DIR) -> bool:
+    """
+    Consumes a pending rebuild request. Removing the marker before rebuilding
+    means a request made while the rebuild runs triggers another one.
+    """
+    try:
+        os.remove(os.path.join(directory, REBUILD_MARKER))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def index_interactions(interactions: Iterable[Any]):
+    """Adds or refreshes the embeddings of the given ORM objects."""
+    items = [(i.id, interaction_text(i)) for i in interactions]
+    if not items:
+        return
+    vectors = embed_batch([text for _, text in items])
+    ids = [interaction_id for interaction_id, _ in items]
+    with _write_lock:
+        get_index().upsert_vectors(ids, vectors)
+        if _rebuild is not None:
+            _rebuild.index.upsert_vectors(ids, vectors)
+            _rebuild.touched.update(ids)
+
+
+def remove_interactions(interaction_ids: Iterable[int]):
+    """Drops the embeddings of deleted interactions."""
+    ids = [int(i) for i in interaction_ids]
+    with _write_lock:
+        get_index().remove_many(ids)
+        if _rebuild is not None:
+            _rebuild.index.remove_many(ids)
+            _rebuild.touched.update(ids)
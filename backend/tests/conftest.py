@@ -0,0 +1,8 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+# app.database builds its engine at import time; nothing here connects to it
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,82 @@
+# backend/tests/test_router.py
+import pytest
+
+from app.agent.router import ToolRouter, describes_new_interaction
+from app.agent.tools import (
+    log_interaction,
+    log_interactions,
+    edit_interaction,
+    search_hcp,
+    find_similar_interactions,
+    suggest_follow_up,
+    generate_summary,
+    check_compliance,
+    set_user_name,
+    extract_interaction_data,
+)
+
+TOOLS = [log_interaction, log_interactions, edit_interaction, search_hcp, find_similar_interactions, suggest_follow_up, generate_summary, check_compliance, set_user_name, extract_interaction_data]
+LOG_TOOLS = {"log_interaction", "log_interactions"}
+
+DICTATIONS = [
+    "Dr Rao liked the efficacy data, I'll follow up with the trial results next week.",
+    "My name is Priya. Dr Mehta was interested in Product X and asked for samples.",
+    "Dr Iyer asked about off-label use in children; I pointed her to medical affairs.",
+]
+
+
+class StubLLM:
+    """Records the tools each binding was built with."""
+
+    def bind_tools(self, tools):
+        return [t.name for t in tools]
+
+
+@pytest.fixture
+def router():
+    return ToolRouter(StubLLM(), TOOLS)
+
+
+@pytest.mark.parametrize("text", DICTATIONS)
+def test_dictation_binds_log_tools(router, text):
+    _, names = router.route(text, extracted=True)
+    assert LOG_TOOLS <= names
+
+
+@pytest.mark.parametrize("text", DICTATIONS)
+def test_auxiliary_intent_alone_binds_all_tools(router, text):
+    _, names = router.route(text)
+    assert names == frozenset(router.tools)
+
+
+def test_auxiliary_intent_adds_to_primary(router):
+    intents, names = router.route("I met Dr Rao today, suggest a follow-up")
+    assert {"log", "follow_up"} <= set(intents)
+    assert names == LOG_TOOLS | {"suggest_follow_up"}
+
+
+def test_search_without_extraction_has_no_log_tools(router):
+    _, names = router.route("Show my interactions with Dr Rao")
+    assert names == {"search_hcp"}
+
+
+def test_extraction_adds_log_tools(router):
+    intents, names = router.route("Show my interactions with Dr Rao", extracted=True)
+    assert "log" in intents
+    assert names == LOG_TOOLS | {"search_hcp"}
+
+
+def test_bindings_match_routed_tools(router):
+    _, names = router.route(DICTATIONS[0], extracted=True)
+    assert set(router.bind(names)) == names
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I met Dr Rao today about Product X", True),
+    ("Dr Rao liked the efficacy data", True),
+    ("Show my interactions with Dr Rao", False),
+    ("Change the outcome of interaction 12 to positive", False),
+    ("I met Dr Rao today, update her phone number too", True),
+])
+def test_describes_new_interaction(text, expected):
+    assert describes_new_interaction(text) is expected